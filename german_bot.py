@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+STARTED_AT = time.perf_counter()  # До импорта discord, чтобы он тоже попал в замер
+
+import discord
+from discord.ext import commands
+
+from _token import TOKEN
+
+# Модули, которые работают в одном процессе и делят одно подключение к Discord
+EXTENSIONS = ["german_music_bot", "german_voice"]
+
+# Discord разрешает не больше max_concurrency IDENTIFY за этот интервал (секунды)
+IDENTIFY_INTERVAL = 5
+
+
+class ExtensionsMixin:
+    startup_logged = False
+
+    async def setup_hook(self):
+        started = time.perf_counter()
+        for extension in EXTENSIONS:
+            await self.load_extension(extension)
+        print(f"Расширения загружены за {time.perf_counter() - started:.2f} с")
+
+    async def on_ready(self):
+        # on_ready повторяется после переподключений, замер нужен только первый
+        if not self.startup_logged:
+            self.startup_logged = True
+            print(f"Бот готов через {time.perf_counter() - STARTED_AT:.2f} с после запуска")
+
+
+class GermanBot(ExtensionsMixin, commands.Bot):
+    """Общий бот: музыка и приветствие с общим менеджером голосовых подключений"""
+
+
+class ShardedGermanBot(ExtensionsMixin, commands.AutoShardedBot):
+    """То же самое, но с несколькими шардами в одном процессе.
+
+    Состояние серверов (очереди, плееры) хранится по guild_id, а события
+    сервера приходят только в шард, которому он принадлежит, поэтому при
+    запуске шардов в разных процессах каждый процесс держит только свои серверы.
+    """
+
+
+def create_bot(sharded=False, shard_ids=None, shard_count=None, processes=1):
+    """processes - сколько процессов делят один токен; по нему расширения делят лимиты на бота"""
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.voice_states = True
+    intents.guilds = True
+    intents.members = True
+    intents.messages = True
+    if sharded or shard_ids is not None:
+        bot = ShardedGermanBot(command_prefix="!", intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+    else:
+        bot = GermanBot(command_prefix="!", intents=intents)
+    bot.process_count = processes
+    return bot
+
+
+async def fetch_gateway_info():
+    """Рекомендованное Discord число шардов и max_concurrency для IDENTIFY"""
+    client = discord.Client(intents=discord.Intents.none())
+    async with client:
+        await client.login(TOKEN)
+        shard_count, _, session_start_limit = await client.http.get_bot_gateway()
+    return shard_count, session_start_limit["max_concurrency"]
+
+
+def run_shards(shard_ids, shard_count, delay, processes):
+    """Точка входа рабочего процесса: свои шарды, свой event loop и свой GIL"""
+    time.sleep(delay)  # Ждём, пока шарды предыдущих процессов пройдут IDENTIFY
+    create_bot(shard_ids=shard_ids, shard_count=shard_count, processes=processes).run(TOKEN)
+
+
+def launch(processes, shard_count=None):
+    """Делит шарды на непрерывные диапазоны и запускает каждый в отдельном процессе"""
+    max_concurrency = 1
+    if shard_count is None:
+        shard_count, max_concurrency = asyncio.run(fetch_gateway_info())
+    shard_count = max(shard_count, processes)
+
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    started = 0
+    for i in range(processes):
+        shard_ids = list(range(shard_count * i // processes, shard_count * (i + 1) // processes))
+        delay = started // max_concurrency * IDENTIFY_INTERVAL
+        worker = context.Process(
+            target=run_shards,
+            args=(shard_ids, shard_count, delay, processes),
+            name=f"shards-{shard_ids[0]}-{shard_ids[-1]}"
+        )
+        worker.start()
+        workers.append(worker)
+        started += len(shard_ids)
+        print(f"Процесс {worker.name}: шарды {shard_ids[0]}-{shard_ids[-1]} из {shard_count}")
+
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Общий бот: музыка и приветствие")
+    parser.add_argument("--sharded", action="store_true", help="AutoShardedBot в одном процессе")
+    parser.add_argument("--processes", type=int, default=1, help="Сколько процессов с шардами запустить")
+    parser.add_argument("--shards", type=int, default=None, help="Общее число шардов (по умолчанию - как советует Discord)")
+    args = parser.parse_args()
+
+    if args.processes > 1:
+        launch(args.processes, args.shards)
+    else:
+        create_bot(sharded=args.sharded or args.shards is not None, shard_count=args.shards).run(TOKEN)
@@ -2,23 +2,32 @@ import discord
 from discord.ext import commands
 from discord.ui import View, Button
 from discord import ButtonStyle
-import yt_dlp
 import asyncio
 import os
+import random
 import re
+import threading
 import time
-from googleapiclient.discovery import build
 
 from _token import TOKEN, YOUTUBE_API_KEY  # Храни API-ключ в _token.py
+from services.audio import PrebufferedSource
+from services.edit_scheduler import EditScheduler
+from services.extractor_pool import ExtractorPool, PRIORITY_BACKGROUND, PRIORITY_METADATA, PRIORITY_PLAY
+from services.guild_player import GuildPlayer
+from services.search_cache import SearchCache
+from services.stream_cache import StreamCache
+from services.track_queue import QueueEntry
+from services.track_store import TrackStore
+from services.voice_manager import MUSIC, get_voice_manager
+from services.youtube_search import YouTubeSearchClient
+from views.queue_view import QueueView
 from views.search_result_view import SearchResultView
 
-# Global variables
-current_view = None
-
 class MusicPlayerView(View):
-    def __init__(self, ctx, title: str, duration: int = None, thumbnail_url: str = None):
+    def __init__(self, ctx, player: GuildPlayer, title: str, duration: int = None, thumbnail_url: str = None):
         super().__init__(timeout=None)
         self.ctx = ctx
+        self.player = player
         self.title = title
         self.duration = duration
         self.thumbnail_url = thumbnail_url
@@ -28,27 +37,66 @@ class MusicPlayerView(View):
         self.is_playing = True
         self.is_paused = False
         self.volume = 1.0  # Default volume
-        self.loop = False  # Track repeat
         self.pause_time = None
         self.guild_id = ctx.guild.id
+        self.static_parts = None  # Части эмбеда, которые не меняются за время трека
+        self.last_fingerprint = None  # Отпечаток последнего отправленного состояния
+        self.loop_button.style = ButtonStyle.green if self.loop else ButtonStyle.gray
+
+    @property
+    def loop(self):
+        """Повтор хранится в плеере сервера и переживает смену трека"""
+        return self.player.loop
 
     async def start_updates(self):
+        if NOW_PLAYING_LOW_TRAFFIC:
+            # Прогресс считает клиент Discord, сообщение правится только при изменениях
+            await self.update_message()
+            return
+        edit_scheduler.register(self)
         self.update_task = asyncio.create_task(self.update_progress())
 
     async def update_progress(self):
         try:
             while self.is_playing:
                 await self.update_message()
-                await asyncio.sleep(5)  # Update every 5 seconds
+                # Период растёт с числом играющих серверов, чтобы не упираться в лимиты
+                await asyncio.sleep(edit_scheduler.refresh_interval)
         except Exception as e:
             print(f"Error in progress update: {e}")
 
+    def get_elapsed(self):
+        """Сколько секунд трека уже проиграно (с учётом паузы)"""
+        if self.is_paused and self.pause_time:
+            return int(self.pause_time - self.start_time)
+        return int(time.time() - self.start_time)
+
+    def set_paused(self, paused: bool):
+        """Запоминает паузу, чтобы она не учитывалась в прогрессе"""
+        if paused == self.is_paused:
+            return
+        self.is_paused = paused
+        self.pause_button.emoji = "▶️" if paused else "⏸️"
+        if paused:
+            self.pause_time = time.time()
+        elif self.pause_time:
+            self.start_time += (time.time() - self.pause_time)
+            self.pause_time = None
+
+    def create_end_time_line(self):
+        """Строка прогресса для экономного режима: время окончания рисует сам клиент Discord"""
+        if self.is_paused:
+            minutes, seconds = divmod(self.get_elapsed(), 60)
+            return f"⏸️ На паузе на `{int(minutes):02d}:{int(seconds):02d}`"
+        if self.duration:
+            return f"⏱️ Закончится <t:{int(self.start_time + self.duration)}:R>"
+        return f"▶️ Играет с <t:{int(self.start_time)}:R>"
+
     def create_progress_bar(self):
+        if NOW_PLAYING_LOW_TRAFFIC:
+            return self.create_end_time_line()
         try:
-            if self.is_paused and self.pause_time:
-                elapsed = int(self.pause_time - self.start_time)
-            else:
-                elapsed = int(time.time() - self.start_time)
+            elapsed = self.get_elapsed()
 
             if self.duration:
                 progress = min(elapsed / self.duration, 1.0)
@@ -68,6 +116,12 @@ class MusicPlayerView(View):
             else:
                 bar = "━" * (filled_length - 1) + "⬤" + "─" * (bar_length - filled_length)
 
+            # У длинных треков время показывается с точностью до минуты,
+            # тогда строка прогресса меняется редко и сообщение реже правится
+            if self.duration and self.duration >= LONG_TRACK_SECONDS:
+                remaining = max(0, self.duration - elapsed)
+                return f"`{elapsed // 60} мин` `{bar}` `-{remaining // 60} мин`"
+
             minutes, seconds = divmod(elapsed, 60)
             time_str = f"{int(minutes):02d}:{int(seconds):02d}"
 
@@ -84,9 +138,31 @@ class MusicPlayerView(View):
             print(f"Error in progress bar: {e}")
             return "`──────────────────`"
 
+    def get_static_parts(self):
+        """Название, иконка автора и длительность считаются один раз на трек"""
+        if self.static_parts is None:
+            title_text = f"**[{self.title}]({self.ctx.message.jump_url})**" if hasattr(self.ctx, 'message') else f"**{self.title}**"
+            duration_str = None
+            if self.duration:
+                minutes, seconds = divmod(self.duration, 60)
+                duration_str = f"⏱️ {int(minutes)}:{int(seconds):02d}"
+            self.static_parts = (title_text, self.ctx.guild.me.display_avatar.url, duration_str)
+        return self.static_parts
+
     async def update_message(self):
         if self.message:
             try:
+                queue = self.player.queue
+                progress_bar = self.create_progress_bar()
+
+                # Отпечаток видимого содержимого (время обновления в него не входит):
+                # если ничего не изменилось, например на паузе, правку не отправляем
+                fingerprint = (progress_bar, self.is_paused, self.loop, self.volume, queue.version)
+                if fingerprint == self.last_fingerprint:
+                    return
+                self.last_fingerprint = fingerprint
+                title_text, author_icon_url, duration_str = self.get_static_parts()
+
                 # Выбираем цвет в зависимости от состояния
                 if self.is_paused:
                     color = discord.Color.orange()
@@ -98,11 +174,7 @@ class MusicPlayerView(View):
                 # Создаем основной эмбед
                 embed = discord.Embed(color=color, timestamp=discord.utils.utcnow())
 
-                # Форматируем название с URL если возможно
-                title_text = f"**[{self.title}]({self.ctx.message.jump_url})**" if hasattr(self.ctx, 'message') else f"**{self.title}**"
-
                 # Добавляем название трека с прогресс баром
-                progress_bar = self.create_progress_bar()
                 description_parts = [
                     title_text,
                     "",  # Пустая строка для отступа
@@ -110,8 +182,8 @@ class MusicPlayerView(View):
                 ]
 
                 # Добавляем информацию о следующем треке если есть
-                if self.guild_id in song_queue and len(song_queue[self.guild_id]) > 1:
-                    next_track = song_queue[self.guild_id][1][1]  # [1] for next track, [0] is current
+                if queue:
+                    next_track = queue[0].title  # В очереди только предстоящие треки
                     description_parts.extend([
                         "",  # Пустая строка для отступа
                         "─" * 20,  # Разделитель
@@ -123,7 +195,7 @@ class MusicPlayerView(View):
                 # Добавляем информацию о плеере
                 embed.set_author(
                     name="Музыкальный плеер",
-                    icon_url=self.ctx.guild.me.display_avatar.url
+                    icon_url=author_icon_url
                 )
 
                 if self.thumbnail_url:
@@ -159,17 +231,16 @@ class MusicPlayerView(View):
                 embed.add_field(name="⠀", value="⠀", inline=True)
 
                 # Добавляем информацию об очереди
-                if self.guild_id in song_queue and len(song_queue[self.guild_id]) > 1:  # > 1 because first track is current
+                if queue:
                     queue_list = []
-                    total_tracks = len(song_queue[self.guild_id])
+                    total_tracks = len(queue)
 
                     # Показываем следующие 3 трека
-                    for i in range(1, min(4, total_tracks)):  # Start from 1 to skip current track
-                        next_title = song_queue[self.guild_id][i][1]
-                        queue_list.append(f"`{i}.` {next_title}")
+                    for i, entry in enumerate(queue[:3]):
+                        queue_list.append(f"`{i + 1}.` {entry.title}")
 
-                    if total_tracks > 4:
-                        remaining = total_tracks - 4
+                    if total_tracks > 3:
+                        remaining = total_tracks - 3
                         tracks_word = 'трек' if remaining == 1 else 'трека' if 1 < remaining < 5 else 'треков'
                         queue_list.append(f"\n`─────`\nИ ещё **{remaining}** {tracks_word} в очереди")
 
@@ -184,16 +255,14 @@ class MusicPlayerView(View):
                 footer_parts = []
 
                 # Добавляем длительность
-                if self.duration:
-                    minutes, seconds = divmod(self.duration, 60)
-                    duration_str = f"{int(minutes)}:{int(seconds):02d}"
-                    footer_parts.append(f"⏱️ {duration_str}")
+                if duration_str:
+                    footer_parts.append(duration_str)
 
                 # Добавляем статус очереди
-                total_tracks = len(song_queue.get(self.guild_id, []))
-                if total_tracks > 1:  # > 1 because first track is current
-                    tracks_word = 'трек' if total_tracks == 2 else 'трека' if 2 < total_tracks < 5 else 'треков'
-                    footer_parts.append(f"📑 {total_tracks - 1} {tracks_word} в очереди")
+                total_tracks = len(queue)
+                if total_tracks > 0:
+                    tracks_word = 'трек' if total_tracks == 1 else 'трека' if 1 < total_tracks < 5 else 'треков'
+                    footer_parts.append(f"📑 {total_tracks} {tracks_word} в очереди")
                 else:
                     footer_parts.append("📑 Очередь пуста")
 
@@ -205,7 +274,7 @@ class MusicPlayerView(View):
                 footer_parts.append("🔄 Обновлено")
                 embed.set_footer(text=" • ".join(footer_parts))
 
-                await self.message.edit(embed=embed, view=self)
+                edit_scheduler.submit(self.message, embed=embed, view=self)
 
             except Exception as e:
                 print(f"Error updating message: {e}")
@@ -215,16 +284,10 @@ class MusicPlayerView(View):
         if interaction.user.voice and interaction.user.voice.channel == self.ctx.voice_client.channel:
             if self.ctx.voice_client.is_playing():
                 self.ctx.voice_client.pause()
-                button.emoji = "▶️"
-                self.is_paused = True
-                self.pause_time = time.time()
+                self.set_paused(True)
             else:
                 self.ctx.voice_client.resume()
-                button.emoji = "⏸️"
-                self.is_paused = False
-                if self.pause_time:
-                    self.start_time += (time.time() - self.pause_time)
-                    self.pause_time = None
+                self.set_paused(False)
             await self.update_message()
             await interaction.response.defer()
         else:
@@ -233,6 +296,8 @@ class MusicPlayerView(View):
     @discord.ui.button(emoji="⏭️", style=ButtonStyle.gray)
     async def skip_button(self, interaction: discord.Interaction, button: Button):
         if interaction.user.voice and interaction.user.voice.channel == self.ctx.voice_client.channel:
+            self.player.current = None  # Пропуск работает и при включенном повторе
+            self.player.check_prepared()  # При повторе был подготовлен этот же трек
             self.ctx.voice_client.stop()
             await interaction.response.send_message("⏭️ Пропускаю трек...", ephemeral=True)
         else:
@@ -273,8 +338,8 @@ class MusicPlayerView(View):
 
             button.emoji = self.get_volume_icon()
 
-            if hasattr(self.ctx.voice_client, 'source') and self.ctx.voice_client.source:
-                self.ctx.voice_client.source.volume = self.volume
+            # Громкость задается фильтром FFmpeg, поэтому перезапускаем поток с текущей позиции
+            restart_source(self.player, self.get_elapsed(), self.volume)
 
             # Показываем текущую громкость с визуальным индикатором
             volume_percentage = int(self.volume * 100)
@@ -293,7 +358,8 @@ class MusicPlayerView(View):
     @discord.ui.button(emoji="🔁", style=ButtonStyle.gray)
     async def loop_button(self, interaction: discord.Interaction, button: Button):
         if interaction.user.voice and interaction.user.voice.channel == self.ctx.voice_client.channel:
-            self.loop = not self.loop
+            self.player.loop = not self.player.loop
+            self.player.check_prepared()  # Следующим теперь играет другой трек
             button.style = ButtonStyle.green if self.loop else ButtonStyle.gray
             await self.update_message()
             await interaction.response.defer()
@@ -302,22 +368,53 @@ class MusicPlayerView(View):
 
     def stop_updates(self):
         self.is_playing = False
+        edit_scheduler.unregister(self)
         if self.update_task:
             self.update_task.cancel()
 
-# Инициализация бота
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# Очередь песен (словарь для каждого сервера)
-song_queue = {}
-
-# Подключение к YouTube API
-youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
-
-# Подключение к YouTube API
-youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+# Голосовые подключения общие с другими модулями бота, задаётся в setup()
+voice_manager = None
+
+# Все правки сообщений бота идут через общий планировщик с учётом лимитов Discord,
+# создаётся в setup(): лимит на бота делится между процессами с шардами
+EDIT_GLOBAL_RATE = (40, 1.0)  # Правок на бота за секунду
+edit_scheduler = None
+# У треков длиннее этого прогресс показывается с точностью до минуты
+LONG_TRACK_SECONDS = 30 * 60
+# Экономный режим: вместо прогресс-бара время окончания трека в формате <t:...:R>,
+# которое отсчитывает клиент Discord; сообщение правится только при изменениях
+NOW_PLAYING_LOW_TRAFFIC = False
+
+# Плееры серверов: очередь, view, предзагрузка и повтор у каждого свои
+players = {}
+
+def get_player(guild):
+    player = players.get(guild.id)
+    if player is None:
+        player = players[guild.id] = GuildPlayer(guild)
+    return player
+
+# Подключение к YouTube API (запросы выполняются вне event loop), создаётся при первом поиске
+youtube_search = None
+
+def get_youtube_search():
+    global youtube_search
+    if youtube_search is None:
+        youtube_search = YouTubeSearchClient(YOUTUBE_API_KEY)
+    return youtube_search
+
+# Локальный индекс метаданных треков по ID видео
+TRACK_STORE_PATH = "tracks.db"
+track_store = TrackStore(TRACK_STORE_PATH)
+
+def store_tracks(records):
+    """Пишет метаданные в индекс в пуле потоков, чтобы коммиты SQLite не останавливали event loop"""
+    def write():
+        try:
+            track_store.put_many(records)
+        except Exception as e:
+            print(f"Ошибка при сохранении метаданных треков: {str(e)}")
+    asyncio.get_running_loop().run_in_executor(None, write)
 
 # Проверка, является ли ссылка плейлистом и извлечение ID плейлиста
 def is_playlist(url):
@@ -327,25 +424,43 @@ def is_playlist(url):
         return True, playlist_match.group(1)
     return False, None
 
-# Получение чистого URL видео без параметров плейлиста
-def clean_video_url(url):
-    # Извлекаем video_id из URL
+# Извлечение 11-символьного ID видео из URL
+def extract_video_id(url):
     video_match = re.search(r'(?:v=|/)([0-9A-Za-z_-]{11}).*', url)
     if video_match:
-        return f'https://www.youtube.com/watch?v={video_match.group(1)}'
+        return video_match.group(1)
+    return None
+
+YOUTUBE_URL_RE = re.compile(r"(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+")
+
+# Получение чистого URL видео без параметров плейлиста
+def clean_video_url(url):
+    video_id = extract_video_id(url)
+    if video_id:
+        return f'https://www.youtube.com/watch?v={video_id}'
     return url
 
-# Функция загрузки аудио
-async def download_audio(url, guild_id):
-    """Получает аудио-стрим и информацию о треке"""
-    global current_view
-    if current_view and not current_view.loop:
-        current_view.stop_updates()
-    ydl_opts = {
+# Пул потоков yt-dlp: у каждого потока свой YoutubeDL
+EXTRACTOR_WORKERS = 3
+EXTRACTOR_TIMEOUT = 60  # Секунд на одно извлечение (включая ожидание в очереди)
+
+# Профили yt-dlp: метаданные не платят за разбор форматов,
+# а разрешение стрима всегда возвращает ссылку на аудио
+YDL_PROFILES = {
+    # Только название/длительность/превью, используется с process=False
+    'metadata': {
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+        'extract_flat': True,
+        'skip_download': True
+    },
+    # Полное извлечение с выбором аудио формата
+    'stream': {
         'format': 'bestaudio[acodec=opus]/bestaudio/best',  # Prefer Opus, fallback to best available
         'quiet': True,
         'no_warnings': True,
-        'extract_flat': 'in_playlist',
+        'noplaylist': True,  # Ссылка с list= должна давать само видео, а не плейлист
         'skip_download': True,
         'force_generic_extractor': False,
         'nocheckcertificate': True,
@@ -359,18 +474,39 @@ async def download_audio(url, guild_id):
         'retries': 10,  # Number of retries for HTTP requests
         'fragment_retries': 10,  # Number of retries for stream fragments
         'retry_sleep': 3  # Time to sleep between retries
+    },
+    # Перечисление треков плейлиста без извлечения каждого видео
+    'playlist': {
+        'quiet': True,
+        'extract_flat': True,
+        'ignoreerrors': True
     }
+}
+
+extractor_pool = None  # Создаётся при первом извлечении
+
+def get_extractor_pool():
+    global extractor_pool
+    if extractor_pool is None:
+        extractor_pool = ExtractorPool(YDL_PROFILES, EXTRACTOR_WORKERS, EXTRACTOR_TIMEOUT)
+    return extractor_pool
+
+# Чтение плейлиста держит поток до последней страницы, поэтому у него свой пул:
+# несколько больших плейлистов не занимают потоки, нужные для разрешения стримов
+PLAYLIST_WORKERS = 2
+playlist_pool = None
 
+def get_playlist_pool():
+    global playlist_pool
+    if playlist_pool is None:
+        playlist_pool = ExtractorPool({'playlist': YDL_PROFILES['playlist']}, PLAYLIST_WORKERS)
+    return playlist_pool
+
+# Функция загрузки аудио
+async def download_audio(url, priority=PRIORITY_PLAY):
+    """Получает аудио-стрим и информацию о треке"""
     try:
-        # Создаем единый экземпляр YoutubeDL для повторного использования
-        if not hasattr(download_audio, 'ydl'):
-            download_audio.ydl = yt_dlp.YoutubeDL(ydl_opts)
-
-        # Используем существующий экземпляр для полного извлечения информации
-        info = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: download_audio.ydl.extract_info(url, download=False)
-        )
+        info = await get_extractor_pool().extract_info(url, 'stream', priority=priority, key=('stream', url))
 
         if not info:
             raise Exception("Не удалось получить информацию о треке")
@@ -379,78 +515,278 @@ async def download_audio(url, guild_id):
         duration = info.get('duration')
         stream_url = info.get('url')
         thumbnail_url = info.get('thumbnail')
+        codec = info.get('acodec')
 
         if not stream_url and 'formats' in info:
             # Выбираем лучший аудио формат
             formats = [f for f in info['formats'] if f.get('acodec') != 'none']
             if formats:
                 stream_url = formats[0]['url']
+                codec = formats[0].get('acodec')
 
         if not stream_url:
             raise Exception("Не найдены форматы для воспроизведения")
 
-        return stream_url, title, duration, thumbnail_url
+        store_tracks([(info.get('id') or extract_video_id(url), title, duration, thumbnail_url)])
+        return stream_url, title, duration, thumbnail_url, codec
     except Exception as e:
         print(f"Ошибка при получении аудио: {str(e)}")
         raise
 
+# Кэш ссылок на стримы: повторы и популярные треки не требуют нового извлечения
+stream_cache = StreamCache(
+    download_audio,
+    key_func=lambda url: extract_video_id(url) or url,
+    # Трек из окна предзагрузки, который нужен прямо сейчас, обгоняет фоновые задачи
+    promoter=lambda url, priority: get_extractor_pool().promote(('stream', url), priority)
+)
+
 # Функция воспроизведения следующего трека
-# Хранилище предзагруженных треков
-preloaded_tracks = {}
+# Сколько треков из начала очереди держать разрешёнными заранее
+PRELOAD_DEPTH = 3
 
-async def preload_next_track(ctx, guild_id):
-    """Предзагружает следующий трек из очереди"""
-    if guild_id in song_queue and len(song_queue[guild_id]) > 0:
-        next_url, next_title = song_queue[guild_id][0]
-        try:
-            stream_url, title, duration, thumbnail_url = await download_audio(next_url, guild_id)
-            preloaded_tracks[guild_id] = {
-                'url': next_url,
-                'title': title,
-                'stream_url': stream_url,
-                'duration': duration,
-                'thumbnail_url': thumbnail_url
-            }
-        except Exception as e:
-            print(f"Ошибка при предзагрузке: {str(e)}")
+async def preload_track(url):
+    """Заранее разрешает стрим трека, результат остаётся в stream_cache"""
+    try:
+        return await stream_cache.get(url, PRIORITY_BACKGROUND)
+    except asyncio.CancelledError:
+        # Трек выпал из окна - извлечение прерывается, если его не ждёт кто-то ещё
+        stream_cache.cancel(url)
+        raise
+    except Exception as e:
+        print(f"Ошибка при предзагрузке: {str(e)}")
+
+def refresh_preloads(player):
+    """Подстраивает окно предзагрузки под текущее начало очереди"""
+    if player.preload_version == player.queue.version:
+        return  # Очередь не менялась
+    player.preload_version = player.queue.version
+
+    window = {entry.url for entry in player.queue[:PRELOAD_DEPTH]}
+    tasks = player.preloads
+
+    # Предзагрузку треков, выпавших из окна, отменяем (разрешённые остаются в кэше)
+    for url in list(tasks):
+        if url not in window:
+            tasks.pop(url).cancel()
+
+    # Новые треки окна разрешаем параллельно, неудачные попытки повторяем
+    for url in window:
+        task = tasks.get(url)
+        if task is None or (task.done() and task.result() is None):
+            tasks[url] = asyncio.create_task(preload_track(url))
+
+def queue_changed(player):
+    """Очередь изменилась: обновляем предзагрузку и сообщение плеера"""
+    refresh_preloads(player)
+    player.check_prepared()
+    if player.view:
+        asyncio.create_task(player.view.update_message())
+
+# Бесшовное воспроизведение: FFmpeg следующего трека запускается заранее
+GAPLESS_MODE = True
+GAPLESS_PREPARE_AHEAD = 10  # За сколько секунд до конца трека готовить следующий
+GAPLESS_BUFFER_FRAMES = 150  # Сколько кадров по 20 мс набрать заранее (3 секунды)
+
+# Opus-стримы при громкости 100% отдаются в Discord без декодирования и перекодирования
+OPUS_PASSTHROUGH = True
+# Выравнивание громкости треков фильтром loudnorm (заметно нагружает CPU)
+LOUDNESS_NORMALIZATION = False
+
+FFMPEG_OPTIONS = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_on_network_error 1 -reconnect_on_http_error 4xx,5xx -timeout 30000000 -nostdin',
+    'options': '-vn -max_muxing_queue_size 1024'
+}
+
+def create_audio_source(stream_url, codec=None, volume=1.0, offset=0, prebuffer=False):
+    """Создает источник звука для стрима (FFmpeg запускается сразу).
+
+    Громкость применяется фильтром внутри FFmpeg, который сам кодирует Opus,
+    так что в потоке плеера нет покадровой обработки на Python.
+    """
+    before_options = FFMPEG_OPTIONS['before_options']
+    if offset:
+        before_options = f"-ss {offset} {before_options}"
+
+    filters = []
+    if LOUDNESS_NORMALIZATION:
+        filters.append("loudnorm=I=-16:TP=-1.5:LRA=11")
+    if volume != 1.0:
+        filters.append(f"volume={volume}")
+
+    if OPUS_PASSTHROUGH and codec == 'opus' and not filters:
+        # Пакеты Opus копируются как есть, FFmpeg только меняет контейнер
+        source = discord.FFmpegOpusAudio(stream_url, codec='copy', before_options=before_options, options='-vn')
+    else:
+        options = FFMPEG_OPTIONS['options']
+        if filters:
+            options += f" -filter:a {','.join(filters)}"
+        source = discord.FFmpegOpusAudio(stream_url, before_options=before_options, options=options)
+
+    if prebuffer:
+        source = PrebufferedSource(source, GAPLESS_BUFFER_FRAMES)
+    return source
+
+def restart_source(player, offset, volume):
+    """Пересоздает источник текущего трека с позиции offset (например, для смены громкости)"""
+    track = player.current_track
+    vc = player.voice_client
+    if not track or not vc or not vc.source:
+        return
+
+    source = create_audio_source(track[0], track[4], volume, offset=offset)
+    paused = vc.is_paused()
+    old_source = vc.source
+    vc.source = source
+    if paused:
+        vc.pause()
+    # Поток плеера может ещё дочитывать кадр из старого источника
+    asyncio.get_running_loop().call_later(1, old_source.cleanup)
+
+async def prepare_next_source(player, view):
+    """Незадолго до конца текущего трека запускает и буферизует следующий"""
+    if not view.duration:
+        return
+
+    # Ждём, пока до конца трека останется GAPLESS_PREPARE_AHEAD секунд (пауза учитывается)
+    while True:
+        remaining = view.duration - view.get_elapsed()
+        if remaining <= GAPLESS_PREPARE_AHEAD:
+            break
+        await asyncio.sleep(min(remaining - GAPLESS_PREPARE_AHEAD, 5))
 
-async def play_next(ctx):
-    """Воспроизводит следующий трек, используя предзагрузку"""
-    global current_view
-    guild_id = ctx.guild.id
+    entry = player.next_entry()
+    if not entry:
+        return
+
+    try:
+        track = await stream_cache.get(entry.url)
+    except Exception as e:
+        print(f"Ошибка при подготовке следующего трека: {str(e)}")
+        return
+
+    # Пока разрешали стрим, очередь могла измениться
+    if player.next_entry() is not entry:
+        return
 
-    if guild_id not in song_queue or not song_queue[guild_id]:
-        await ctx.send("🎵 Очередь пуста, ожидаю новые треки...")
+    player.discard_prepared()
+    # Дальше очередь меняется только через queue_changed, который проверяет prepared
+    player.prepared = (entry, create_audio_source(track[0], track[4], prebuffer=True), track)
+
+# Трек, оборвавшийся раньше конца больше чем на столько секунд, считается сбоем стрима
+STREAM_EARLY_END = 15
+STREAM_RETRIES = 1  # Сколько раз подряд разрешать такой трек заново, прежде чем пропустить
+
+def stream_broken(player, error):
+    """Трек закончился из-за ошибки или мёртвой ссылки, а не доиграл и не был пропущен"""
+    if error:
+        return True
+    view = player.view
+    if not player.current or not view or not view.duration:
+        return False  # !skip и !stop сбрасывают current
+    return view.get_elapsed() < view.duration - STREAM_EARLY_END
+
+def on_track_end(ctx, error):
+    """Вызывается из потока плеера: сразу запускает подготовленный трек, если он есть.
+
+    Очередь отсюда не читается - она меняется в event loop. Подготовленный трек
+    выбрасывается там же при изменении очереди, а play_next снимает с очереди
+    именно его.
+    """
+    player = get_player(ctx.guild)
+    broken = False
+    try:
+        if error:
+            print(f"Ошибка при воспроизведении: {str(error)}")
+        broken = stream_broken(player, error)
+        prepared = player.take_prepared()
+        if prepared:
+            if not broken and player.voice_client:
+                try:
+                    player.voice_client.play(prepared[1], after=lambda e: on_track_end(ctx, e))
+                except Exception:
+                    prepared[1].cleanup()  # Иначе FFmpeg и поток буферизации останутся висеть
+                    raise
+                asyncio.run_coroutine_threadsafe(play_next(ctx, prepared), ctx.bot.loop)
+                return
+            prepared[1].cleanup()
+    except Exception as e:
+        print(f"Ошибка при бесшовном переключении: {str(e)}")
+    asyncio.run_coroutine_threadsafe(play_next(ctx, broken=broken), ctx.bot.loop)
+
+def music_playing(player):
+    """В канале уже звучит (или стоит на паузе) музыка, а не приветствие"""
+    vc = player.voice_client
+    return bool(vc) and (vc.is_playing() or vc.is_paused()) and voice_manager.owner(player.guild_id) == MUSIC
+
+async def play_next(ctx, prepared=None, broken=False):
+    """Воспроизводит следующий трек, используя предзагрузку.
+
+    prepared - трек, который on_track_end уже запустил в потоке плеера;
+    тогда остаётся только обновить очередь и сообщение.
+    broken - текущий трек оборвался: его ссылка выбрасывается из кэша,
+    и трек играет ещё раз со свежей ссылкой.
+    На сервере трек запускает только один вызов за раз: повторный вызов,
+    пока трек запускается или уже играет, ничего не делает.
+    """
+    player = get_player(ctx.guild)
+    if not prepared and (player.starting or music_playing(player)):
         return
+    player.starting = True
+    try:
+        await start_next_track(ctx, player, prepared, broken)
+    finally:
+        player.starting = False
+
+async def start_next_track(ctx, player, prepared, broken):
+    """Выбирает следующий трек и запускает его (вызывается только из play_next)"""
+    player.stream_retries = player.stream_retries + 1 if broken else 0
+    if broken and player.current:
+        # Ссылка могла перестать работать раньше срока из expire=
+        stream_cache.invalidate(player.current.url)
+        if player.stream_retries > STREAM_RETRIES:
+            await ctx.send(f"❌ Трек постоянно обрывается, пропускаю: {player.current.title}")
+            player.current = None
 
     # Получаем следующий трек
-    if current_view and current_view.loop:
-        url, title = song_queue[guild_id][0]  # Don't pop when looping
-    else:
-        url, title = song_queue[guild_id].pop(0)
+    if prepared:
+        # Уже играет: снимаем с очереди именно этот трек (при повторе это текущий)
+        entry = prepared[0]
+        if entry is not player.current:
+            player.queue.remove(entry)
+        player.current = entry
+    # При повторе и после обрыва играем текущий трек ещё раз
+    elif not (player.current and (player.loop or broken)):
+        if not player.queue:
+            player.current = None
+            voice_manager.release(ctx.guild.id, MUSIC)  # Подключением может воспользоваться приветствие
+            await ctx.send("🎵 Очередь пуста, ожидаю новые треки...")
+            return
+        player.current = player.queue.popleft()
+    url = player.current.url
+
+    # Отменяем подготовку, запланированную для предыдущего трека
+    if player.gapless_task:
+        player.gapless_task.cancel()
+        player.gapless_task = None
 
     try:
-        # Проверяем, есть ли предзагруженный трек
-        if guild_id in preloaded_tracks and preloaded_tracks[guild_id]['url'] == url:
-            stream_url = preloaded_tracks[guild_id]['stream_url']
-            title = preloaded_tracks[guild_id]['title']
-            duration = preloaded_tracks[guild_id]['duration']
-            thumbnail_url = preloaded_tracks[guild_id]['thumbnail_url']
-            del preloaded_tracks[guild_id]
+        if prepared:
+            track = prepared[2]
         else:
-            stream_url, title, duration, thumbnail_url = await download_audio(url, guild_id)
-
-        ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_on_network_error 1 -reconnect_on_http_error 4xx,5xx -timeout 30000000 -nostdin',
-            'options': '-vn -filter:a volume=1.0 -max_muxing_queue_size 1024'
-        }
-        source = discord.PCMVolumeTransformer(
-            discord.FFmpegPCMAudio(stream_url, **ffmpeg_options),
-            volume=1.0
-        )
+            # Предзагруженный трек уже лежит в stream_cache
+            track = await stream_cache.get(url)
+        stream_url, title, duration, thumbnail_url, codec = track
+        player.current_track = track
 
         # Создаем новый view для трека
-        view = MusicPlayerView(ctx, title, duration, thumbnail_url)
+        view = MusicPlayerView(ctx, player, title, duration, thumbnail_url)
+
+        # Начинаем воспроизведение до отправки сообщения, чтобы не было паузы
+        if not prepared:
+            voice_manager.claim(ctx.guild, MUSIC)  # Останавливает приветствие, если оно играет
+            source = create_audio_source(stream_url, codec)
+            player.voice_client.play(source, after=lambda e: on_track_end(ctx, e))
 
         # Создаем embed с информацией о треке
         embed = discord.Embed(
@@ -466,11 +802,11 @@ async def play_next(ctx):
         embed.add_field(name="Прогресс", value=view.create_progress_bar(), inline=False)
 
         # Добавляем информацию об очереди
-        if len(song_queue[guild_id]) > 0:
-            next_song = song_queue[guild_id][0][1]  # Получаем название следующего трека
+        if len(player.queue) > 0:
+            next_song = player.queue[0].title  # Получаем название следующего трека
             queue_info = f"Следующий: **{next_song}**"
-            if len(song_queue[guild_id]) > 1:
-                queue_info += f"\nВ очереди: **{len(song_queue[guild_id]) - 1}** треков"
+            if len(player.queue) > 1:
+                queue_info += f"\nВ очереди: **{len(player.queue) - 1}** треков"
             embed.add_field(name="Очередь", value=queue_info, inline=False)
 
         # Отправляем сообщение с view и сохраняем его
@@ -479,27 +815,29 @@ async def play_next(ctx):
         # Запускаем обновление прогресса
         await view.start_updates()
 
-        # Сохраняем текущий view
-        if current_view:
-            current_view.stop_updates()
-        current_view = view
+        # Сохраняем текущий view (прошлый view этого сервера перестает обновляться)
+        player.set_view(view)
 
-        # Начинаем воспроизведение
-        ctx.voice_client.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop))
+        # Предзагружаем следующие треки
+        refresh_preloads(player)
 
-        # Предзагружаем следующий трек
-        asyncio.create_task(preload_next_track(ctx, guild_id))
+        # Готовим следующий трек к бесшовному переключению
+        if GAPLESS_MODE:
+            player.gapless_task = asyncio.create_task(prepare_next_source(player, view))
 
     except Exception as e:
         await ctx.send(f"❌ Ошибка при воспроизведении: {str(e)}")
-        # В случае ошибки пытаемся воспроизвести следующий трек
+        if music_playing(player):
+            return  # Музыка всё-таки играет - не сбиваем её и не трогаем кэш
+        stream_cache.invalidate(url)  # Следующая попытка разрешит трек заново
+        # В случае ошибки пытаемся воспроизвести следующий трек (даже при повторе)
+        player.current = None
         asyncio.create_task(play_next(ctx))
 
 # Подключение к голосовому каналу
 async def ensure_voice(ctx):
     if ctx.author.voice:
-        if ctx.voice_client is None:
-            await ctx.author.voice.channel.connect()
+        await voice_manager.connect(ctx.author.voice.channel, MUSIC, move=False)
     else:
         await ctx.send("Вы должны быть в голосовом канале!")
         return False
@@ -507,135 +845,211 @@ async def ensure_voice(ctx):
 
 # Функция поиска видео на YouTube
 MAX_SEARCH_RESULTS = 10  # Сколько вариантов показывать пользователю
+MAX_SEARCH_DURATION = 15 * 60  # Более длинные видео в выдачу не попадают
+SEARCH_VIDEO_DURATION = None  # Фильтр API: "short", "medium", "long" или None
+
+# Кэш результатов поиска: популярные запросы не тратят квоту API
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 6 * 60 * 60  # 6 часов
+SEARCH_CACHE_PATH = "search_cache.json"  # None - не сохранять на диск
+SEARCH_CACHE_SAVE_INTERVAL = 60  # Новые записи сохраняются на диск не чаще раза в минуту
+search_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_PATH)
+search_cache_task = None
+
+def log_search_cache_stats():
+    stats = search_cache.stats()
+    print(
+        f"Кэш поиска: {stats['size']} записей, попаданий {stats['hits']}, "
+        f"промахов {stats['misses']} ({stats['hit_rate']:.0%})"
+    )
 
-def search_youtube(query):
-    search_response = youtube.search().list(
-        q=query,
-        part="snippet",
-        maxResults=25,  # Берём с запасом, часть отсеется фильтром по длительности
-        type="video",
-        videoEmbeddable="true",
-        order="relevance",  # Sort by relevance
-        safeSearch="none",
-    ).execute()
-
-    # Пропускаем элементы без videoId (каналы/плейлисты иногда проскакивают)
-    video_ids = [
-        item["id"]["videoId"]
-        for item in search_response["items"]
-        if item.get("id", {}).get("videoId")
-    ]
-    if not video_ids:
-        return []
-
-    # Get detailed video information including duration
-    videos_response = youtube.videos().list(
-        part="contentDetails,statistics,snippet",
-        id=",".join(video_ids)
-    ).execute()
-
-    results = []
-    for item in videos_response["items"]:
-        video_id = item["id"]
-        snippet = item["snippet"]
-        content_details = item["contentDetails"]
-
-        # Parse duration from ISO 8601 format
-        duration_str = content_details["duration"].replace("PT", "")
-        duration = ""
-        if "H" in duration_str:
-            hours, duration_str = duration_str.split("H")
-            duration += f"{hours}:"
-        if "M" in duration_str:
-            minutes, duration_str = duration_str.split("M")
-            duration += f"{int(minutes):02d}:"
-        if "S" in duration_str:
-            seconds = duration_str.replace("S", "")
-            duration += f"{int(seconds):02d}"
-        else:
-            duration += "00"
-
-        if ":" not in duration:
-            duration = f"0:{duration}"
-
-        # Filter out videos longer than 15 minutes
-        duration_parts = duration.split(":")
-        total_minutes = int(duration_parts[-2]) if len(duration_parts) > 1 else 0
-        if len(duration_parts) > 2:
-            total_minutes += int(duration_parts[0]) * 60
-
-        if total_minutes <= 15:
-            results.append({
-                "title": snippet["title"],
-                "url": f"https://www.youtube.com/watch?v={video_id}",
-                "duration": duration,
-                "channel": snippet["channelTitle"]
-            })
-
-        if len(results) >= MAX_SEARCH_RESULTS:
-            break
-
+async def flush_search_cache():
+    """Периодически сохраняет кэш поиска, если в нём появились новые записи"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SEARCH_CACHE_SAVE_INTERVAL)
+        if search_cache.dirty:
+            await loop.run_in_executor(None, search_cache.save)
+            log_search_cache_stats()
+
+def known_duration(video_id):
+    """Длительность из локального индекса - для таких видео videos.list не нужен"""
+    metadata = track_store.get(video_id)
+    return metadata['duration'] if metadata else None
+
+# Сколько первых результатов поиска разрешать заранее, пока открыт выбор
+SEARCH_PREFETCH_COUNT = 3
+
+async def prefetch_search_result(url):
+    """Спекулятивно разрешает стрим результата поиска; результат остаётся в stream_cache"""
+    try:
+        await stream_cache.get(url, PRIORITY_BACKGROUND)
+    except asyncio.CancelledError:
+        # Выбор закрыт или выбран другой трек - извлечение больше не нужно
+        stream_cache.cancel(url)
+        raise
+    except Exception as e:
+        print(f"Ошибка при предзагрузке результата поиска: {str(e)}")
+
+async def search_youtube(query):
+    results = search_cache.get(query)
+    if results is not None:
+        return results
+
+    results = await get_youtube_search().search(
+        query, MAX_SEARCH_RESULTS,
+        max_duration=MAX_SEARCH_DURATION,
+        video_duration=SEARCH_VIDEO_DURATION,
+        known_durations=known_duration
+    )
+    store_tracks([
+        (result["video_id"], result["title"], result["duration"], result["thumbnail_url"]) for result in results
+    ])
+    search_cache.put(query, results)  # На диск попадёт при следующем flush_search_cache
     return results
 
 # Функция обработки одиночного трека
+async def resolve_metadata(url):
+    """Возвращает (title, video_id, duration) трека или None"""
+    # Сначала смотрим в локальный индекс - повторный трек не требует запросов
+    video_id = extract_video_id(url)
+    metadata = track_store.get(video_id)
+    if metadata:
+        return metadata['title'], video_id, metadata['duration']
+
+    info = await get_extractor_pool().extract_info(url, 'metadata', priority=PRIORITY_METADATA, process=False)
+    if not info:
+        return None
+
+    title = info.get('title', 'Неизвестный трек')
+    duration = info.get('duration')
+    store_tracks([(info.get('id') or video_id, title, duration, info.get('thumbnail'))])
+    return title, video_id, duration
+
 async def process_play(ctx, url):
     """Добавляет трек в очередь и загружает его"""
-    guild_id = ctx.guild.id
-    if guild_id not in song_queue:
-        song_queue[guild_id] = []
+    player = get_player(ctx.guild)
 
     try:
-        # Используем существующий экземпляр YoutubeDL для быстрого получения информации
-        if not hasattr(download_audio, 'ydl'):
-            ydl_opts = {
-                'quiet': True,
-                'noplaylist': True,
-                'extract_flat': True,
-                'no_warnings': True
-            }
-            download_audio.ydl = yt_dlp.YoutubeDL(ydl_opts)
-
-        info = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: download_audio.ydl.extract_info(url, download=False, process=False)
-        )
-
-        if not info:
+        metadata = await resolve_metadata(url)
+        if not metadata:
             await ctx.send("❌ Не удалось получить информацию о треке")
             return
+        title, video_id, duration = metadata
 
-        title = info.get('title', 'Неизвестный трек')
-        song_queue[guild_id].append((url, title))
+        player.queue.append(QueueEntry(url, title, video_id, duration, ctx.author.id))
         await ctx.send(f"✅ Добавлено в очередь: {title}")
 
-        # Если это единственный трек в очереди, начинаем воспроизведение
-        if len(song_queue[guild_id]) == 1 and not ctx.voice_client.is_playing():
+        # Если ничего не играет и не запускается, начинаем воспроизведение
+        if ctx.voice_client and player.idle:
             await play_next(ctx)
-        # Если это второй трек, запускаем предзагрузку
-        elif len(song_queue[guild_id]) == 1:
-            asyncio.create_task(preload_next_track(ctx, guild_id))
+        # Иначе трек мог попасть в окно предзагрузки и в сообщение плеера
+        else:
+            queue_changed(player)
 
     except Exception as e:
         await ctx.send(f"❌ Ошибка при добавлении трека: {str(e)}")
 
+# Несколько треков одной командой: по одному на строку или ссылки через запятую
+MAX_BATCH_ITEMS = 25
+
+def split_batch(query):
+    """Разбивает запрос на элементы пакета; обычный запрос остаётся одним элементом"""
+    items = [line.strip() for line in query.splitlines() if line.strip()]
+    if len(items) == 1 and "," in items[0]:
+        # Запятые бывают и в названиях, поэтому делим только список ссылок
+        parts = [part.strip() for part in items[0].split(",") if part.strip()]
+        if all(YOUTUBE_URL_RE.match(part) for part in parts):
+            items = parts
+    return items
+
+async def resolve_batch_item(item):
+    """Возвращает (url, title, video_id, duration) для ссылки или первого результата поиска"""
+    if YOUTUBE_URL_RE.match(item):
+        if not extract_video_id(item):
+            return None  # Плейлисты добавляются отдельной командой
+        url = clean_video_url(item)
+        metadata = await resolve_metadata(url)
+        return (url, *metadata) if metadata else None
+
+    results = await search_youtube(item)
+    if not results:
+        return None
+    result = results[0]
+    return result["url"], result["title"], result["video_id"], result["duration"]
+
+async def process_batch(ctx, items):
+    """Разрешает все элементы параллельно и добавляет их в очередь в исходном порядке"""
+    player = get_player(ctx.guild)
+    status_msg = await ctx.send(f"⏳ Добавляю треков: **{len(items)}**...")
+
+    resolved = await asyncio.gather(*(resolve_batch_item(item) for item in items), return_exceptions=True)
+
+    added, failed = [], []
+    for item, result in zip(items, resolved):
+        if isinstance(result, Exception) or result is None:
+            failed.append(item)
+            continue
+        url, title, video_id, duration = result
+        player.queue.append(QueueEntry(url, title, video_id, duration, ctx.author.id))
+        added.append(title)
+
+    # Один итоговый ответ вместо сообщения на каждый трек
+    lines = []
+    if added:
+        tracks_word = 'трек' if len(added) == 1 else 'трека' if 1 < len(added) < 5 else 'треков'
+        lines.append(f"✅ Добавлено в очередь: **{len(added)}** {tracks_word}")
+        lines.extend(f"`{i}.` {title}" for i, title in enumerate(added[:10], 1))
+        if len(added) > 10:
+            lines.append(f"И ещё **{len(added) - 10}**...")
+    if failed:
+        lines.append(f"❌ Не удалось добавить: {', '.join(f'`{item[:50]}`' for item in failed[:5])}")
+    edit_scheduler.submit(status_msg, content="\n".join(lines))
+
+    if added:
+        if ctx.voice_client and player.idle:
+            await play_next(ctx)
+        else:
+            queue_changed(player)
+
 # Функция обработки плейлиста
-def create_loading_bar(current, total, length=16):
-    """Создает визуальный индикатор загрузки"""
-    filled_length = int(length * current / total)
-    if filled_length == 0:
-        bar = "○" + "┈" * (length - 1)
-    elif filled_length == length:
-        bar = "━" * (length - 1) + "●"
-    else:
-        bar = "━" * (filled_length - 1) + "⦿" + "┈" * (length - filled_length)
-    percent = int(100.0 * current / total)
-    return f"`{bar}` **{percent}%**"
+# Плейлист читается постранично в отдельном пуле: первый трек начинает играть,
+# как только он известен, остальные дописываются в очередь в фоне
+PLAYLIST_BATCH_SIZE = 100  # Примерно одна страница плейлиста YouTube
+
+def enumerate_playlist(url, loop, batches, cancel_event, first_batch_size):
+    """Возвращает задачу для пула, которая отправляет треки плейлиста пачками в batches.
+
+    Пачки - (название плейлиста, [entry, ...]), в конце всегда кладётся None.
+    """
+    def job(ydl):
+        try:
+            # process=False оставляет entries ленивым генератором: следующая
+            # страница запрашивается, только когда до неё дошла итерация
+            info = ydl.extract_info(url, download=False, process=False)
+            while info and info.get('_type') in ('url', 'url_transparent'):
+                info = ydl.extract_info(info['url'], download=False, process=False)
+            if not info:
+                return
+            playlist_title = info.get('title') or 'Плейлист'
+            batch, batch_size = [], first_batch_size
+            for entry in info.get('entries') or []:
+                if cancel_event.is_set():
+                    return
+                if entry and entry.get('url') and entry.get('title'):
+                    batch.append(entry)
+                if len(batch) >= batch_size:
+                    loop.call_soon_threadsafe(batches.put_nowait, (playlist_title, batch))
+                    batch, batch_size = [], PLAYLIST_BATCH_SIZE
+            if batch:
+                loop.call_soon_threadsafe(batches.put_nowait, (playlist_title, batch))
+        finally:
+            loop.call_soon_threadsafe(batches.put_nowait, None)
+    return job
 
 async def process_playlist(ctx, url, shuffle=False):
-    """Обрабатывает скачивание и добавление плейлиста в очередь"""
-    guild_id = ctx.guild.id
-    if guild_id not in song_queue:
-        song_queue[guild_id] = []
+    """Запускает фоновую загрузку плейлиста в очередь"""
+    player = get_player(ctx.guild)
 
     loading_msg = await ctx.send(
         "🎵 **Загрузка плейлиста**\n"
@@ -643,91 +1057,123 @@ async def process_playlist(ctx, url, shuffle=False):
         "⏳ Получение информации..."
     )
 
-    ydl_opts = {
-        "quiet": True,
-        "extract_flat": True,
-        "playlistend": 50,  # Увеличиваем лимит треков
-        "ignoreerrors": True
-    }
-
+    cancel_event = threading.Event()
+    task = asyncio.create_task(ingest_playlist(ctx, player, url, shuffle, loading_msg, cancel_event))
+    # Загрузку останавливают !stop и !clear
+    player.ingestions.add((task, cancel_event))
+    task.add_done_callback(lambda _: player.ingestions.discard((task, cancel_event)))
+
+async def ingest_playlist(ctx, player, url, shuffle, loading_msg, cancel_event):
+    """Дописывает треки плейлиста в очередь по мере их получения"""
+    batches = asyncio.Queue()
+    # Без перемешивания первый трек отправляется сразу, чтобы музыка заиграла
+    # без ожидания остальных; при перемешивании ждём первую страницу целиком
+    job = enumerate_playlist(url, asyncio.get_running_loop(), batches, cancel_event,
+                             PLAYLIST_BATCH_SIZE if shuffle else 1)
+    extraction = asyncio.create_task(get_playlist_pool().run(job, 'playlist', timeout=0))
+
+    playlist_title = 'Плейлист'
+    tracks_added = 0
+    status = "🔀 Перемешивание" if shuffle else "⏳ Загрузка"
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            playlist_title = info.get('title', 'Плейлист')
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                break
+            playlist_title, entries = batch
+
+            for entry in entries:
+                queue_entry = QueueEntry(
+                    entry["url"], entry["title"], entry.get("id"), entry.get("duration"), ctx.author.id
+                )
+                if shuffle:
+                    # Вставка на случайное место среди уже добавленных треков
+                    # плейлиста - перемешивание по мере загрузки
+                    start = max(0, len(player.queue) - tracks_added)
+                    player.queue.insert(random.randint(start, len(player.queue)), queue_entry)
+                else:
+                    player.queue.append(queue_entry)
+                tracks_added += 1
+            # Вся пачка пишется в индекс одной транзакцией вне event loop
+            store_tracks([(entry.get("id"), entry["title"], entry.get("duration"), None) for entry in entries])
+
+            # Начинаем воспроизведение, как только известен первый трек
+            if ctx.voice_client and player.idle:
+                await play_next(ctx)
+            else:
+                queue_changed(player)
+
+            edit_scheduler.submit(
+                loading_msg,
+                content=(
+                    f"🎵 **{playlist_title}**\n"
+                    f"{'┄' * 28}\n"
+                    f"{status} треков\n"
+                    f"📥 Добавлено: **{tracks_added}**"
+                )
+            )
 
-            if "entries" in info:
-                valid_entries = [entry for entry in info["entries"] if entry is not None and "url" in entry and "title" in entry]
-                total_tracks = len(valid_entries)
+        await extraction  # Пробрасываем ошибку извлечения, если она была
 
-                if total_tracks > 0:
-                    # Обновляем сообщение с названием плейлиста
-                    tracks_word = 'трек' if total_tracks == 1 else 'трека' if 1 < total_tracks < 5 else 'треков'
-                    await loading_msg.edit(
-                        content=(
-                            f"🎵 **{playlist_title}**\n"
-                            f"{'─' * 32}\n"
-                            f"⏳ Подготовка плейлиста...\n"
-                            f"📑 Найдено: **{total_tracks}** {tracks_word}"
-                        )
-                    )
-
-                    # Перемешиваем треки если нужно
-                    if shuffle:
-                        import random
-                        random.shuffle(valid_entries)
-
-                    # Добавляем треки в очередь
-                    tracks_added = 0
-                    for entry in valid_entries:
-                        song_queue[guild_id].append((entry["url"], entry["title"]))
-                        tracks_added += 1
-
-                        # Обновляем прогресс-бар каждые 5 треков
-                        if tracks_added % 5 == 0 or tracks_added == total_tracks:
-                            progress_bar = create_loading_bar(tracks_added, total_tracks)
-                            status = "🔀 Перемешивание" if shuffle else "⏳ Загрузка"
-                            await loading_msg.edit(
-                                content=(
-                                    f"🎵 **{playlist_title}**\n"
-                                    f"{'┄' * 28}\n"
-                                    f"{status} треков\n"
-                                    f"{progress_bar}\n"
-                                    f"📥 **{tracks_added}** из **{total_tracks}**"
-                                )
-                            )
-
-                    # Формируем сообщение о результате
-                    tracks_word = 'трек' if tracks_added == 1 else 'трека' if 1 < tracks_added < 5 else 'треков'
-                    mode_text = "🔀 Перемешано" if shuffle else "📑 По порядку"
-                    await loading_msg.edit(
-                        content=(
-                            f"✅ **Плейлист загружен**\n"
-                            f"{'┄' * 28}\n"
-                            f"🎵 **{playlist_title}**\n"
-                            f"📥 **{tracks_added}** {tracks_word} | {mode_text}"
-                        )
-                    )
+        if tracks_added == 0:
+            edit_scheduler.submit(loading_msg, content="❌ В плейлисте нет доступных треков")
+            return
 
-                    # Начинаем воспроизведение, если ничего не играет
-                    if not ctx.voice_client.is_playing():
-                        await play_next(ctx)
-                else:
-                    await loading_msg.edit(content="❌ В плейлисте нет доступных треков")
-            else:
-                await loading_msg.edit(content="❌ Не удалось загрузить плейлист")
+        # Формируем сообщение о результате
+        tracks_word = 'трек' if tracks_added == 1 else 'трека' if 1 < tracks_added < 5 else 'треков'
+        mode_text = "🔀 Перемешано" if shuffle else "📑 По порядку"
+        edit_scheduler.submit(
+            loading_msg,
+            content=(
+                f"✅ **Плейлист загружен**\n"
+                f"{'┄' * 28}\n"
+                f"🎵 **{playlist_title}**\n"
+                f"📥 **{tracks_added}** {tracks_word} | {mode_text}"
+            )
+        )
 
+    except asyncio.CancelledError:
+        cancel_event.set()
+        extraction.cancel()
+        edit_scheduler.submit(loading_msg, content=f"⏹ Загрузка плейлиста остановлена, добавлено: **{tracks_added}**")
+        raise
     except Exception as e:
-        await loading_msg.edit(content=f"❌ Ошибка при загрузке плейлиста: {str(e)}")
+        cancel_event.set()
+        edit_scheduler.submit(loading_msg, content=f"❌ Ошибка при загрузке плейлиста: {str(e)}")
+
+def release_unused_voice(ctx):
+    """Отдаёт подключение, если !play так ничего и не запустил.
+
+    ensure_voice забирает подключение под музыку на каждый !play, а поиск могут
+    не выбрать, ссылка может не разрешиться. Загружающийся плейлист сам заберёт
+    подключение в play_next.
+    """
+    player = get_player(ctx.guild)
+    if player.idle and not player.queue:
+        voice_manager.release(ctx.guild.id, MUSIC)
 
 # Команды
-@bot.command(name="play", aliases=["p"], help="Добавляет трек или плейлист в очередь. Пример: !play <запрос/ссылка>")
+@commands.command(name="play", aliases=["p"], help="Добавляет трек или плейлист в очередь. Пример: !play <запрос/ссылка>. Несколько треков - по одному на строку или ссылки через запятую")
 async def play(ctx, *, query: str):
     """Добавляет в очередь видео или плейлист"""
+    try:
+        await handle_play(ctx, query)
+    finally:
+        release_unused_voice(ctx)
+
+async def handle_play(ctx, query):
     if not await ensure_voice(ctx):
         return
 
-    youtube_url_regex = re.compile(r"(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+")
-    if youtube_url_regex.match(query):
+    items = split_batch(query)
+    if len(items) > 1:
+        if len(items) > MAX_BATCH_ITEMS:
+            await ctx.send(f"❌ За один раз можно добавить не больше {MAX_BATCH_ITEMS} треков")
+            return
+        await process_batch(ctx, items)
+        return
+
+    if YOUTUBE_URL_RE.match(query):
         is_pl, playlist_id = is_playlist(query)
         if is_pl:
             # Если URL содержит и видео, и плейлист
@@ -793,71 +1239,155 @@ async def play(ctx, *, query: str):
             await process_play(ctx, query)
     else:
         # Поиск по текстовому запросу
-        results = search_youtube(query)
+        try:
+            results = await search_youtube(query)
+        except asyncio.TimeoutError:
+            await ctx.send("❌ YouTube не ответил вовремя, попробуйте ещё раз.")
+            return
         if not results:
             await ctx.send("❌ Ничего не найдено на YouTube.")
             return
 
         # Создаем и отображаем view с результатами поиска
-        view = SearchResultView(ctx, results)
+        view = SearchResultView(ctx, results, prefetch=prefetch_search_result, prefetch_count=SEARCH_PREFETCH_COUNT)
         await view.show_search_results()
 
-@bot.command(name="skip", aliases=["s"], help="Пропускает текущий трек.")
+@commands.command(name="skip", aliases=["s"], help="Пропускает текущий трек.")
 async def skip(ctx):
     """Пропускает текущий трек"""
     if ctx.voice_client and ctx.voice_client.is_playing():
+        player = get_player(ctx.guild)
+        player.current = None  # Пропуск работает и при включенном повторе
+        player.check_prepared()  # При повторе был подготовлен этот же трек
         ctx.voice_client.stop()
         await ctx.send("⏭ Пропускаю трек...")
 
-@bot.command(name="queue", aliases=["q"], help="Показывает текущую очередь треков.")
+@commands.command(name="queue", aliases=["q"], help="Показывает текущую очередь треков.")
 async def queue(ctx):
     """Показывает очередь треков"""
-    guild_id = ctx.guild.id
-    if guild_id in song_queue and song_queue[guild_id]:
-        queue_list = "\n".join([f"{i+1}. {title}" for i, (_, title) in enumerate(song_queue[guild_id])])
-        await ctx.send(f"📜 Очередь:\n{queue_list}")
+    player = get_player(ctx.guild)
+    if player.queue:
+        await QueueView(ctx, player).show_queue()
     else:
         await ctx.send("📭 Очередь пуста!")
 
-@bot.command(name="pause", help="Ставит воспроизведение на паузу.")
+@commands.command(name="pause", help="Ставит воспроизведение на паузу.")
 async def pause(ctx):
     """Ставит текущий трек на паузу"""
     if ctx.voice_client and ctx.voice_client.is_playing():
         ctx.voice_client.pause()
+        player = get_player(ctx.guild)
+        if player.view:
+            player.view.set_paused(True)
+            await player.view.update_message()
         await ctx.send("⏸ Музыка на паузе!")
 
-@bot.command(name="resume", help="Возобновляет воспроизведение.")
+@commands.command(name="resume", help="Возобновляет воспроизведение.")
 async def resume(ctx):
     """Возобновляет воспроизведение"""
     if ctx.voice_client and ctx.voice_client.is_paused():
         ctx.voice_client.resume()
+        player = get_player(ctx.guild)
+        if player.view:
+            player.view.set_paused(False)
+            await player.view.update_message()
         await ctx.send("▶ Продолжаю воспроизведение!")
 
-@bot.command(name="stop", help="Останавливает воспроизведение и очищает очередь.")
+@commands.command(name="stop", help="Останавливает воспроизведение и очищает очередь.")
 async def stop(ctx):
     """Останавливает воспроизведение и очищает очередь"""
     if ctx.voice_client:
+        player = get_player(ctx.guild)
+        player.clear()
+        player.current = None
+        player.set_view(None)
+        voice_manager.release(ctx.guild.id, MUSIC)
         ctx.voice_client.stop()
-        song_queue[ctx.guild.id] = []
         await ctx.send("⏹ Воспроизведение остановлено и очередь очищена!")
 
-@bot.command(name="remove", help="Удаляет трек из очереди по его номеру. Пример: !remove <номер>")
+@commands.command(name="remove", help="Удаляет трек из очереди по его номеру. Пример: !remove <номер>")
 async def remove(ctx, index: int):
     """Удаляет трек из очереди по его номеру"""
-    guild_id = ctx.guild.id
-    if 0 < index <= len(song_queue[guild_id]):
-        removed_song = song_queue[guild_id].pop(index - 1)
-        await ctx.send(f"🗑 Удалено: {removed_song[1]}")
+    player = get_player(ctx.guild)
+    if 0 < index <= len(player.queue):
+        removed_song = player.queue.pop(index - 1)
+        queue_changed(player)
+        await ctx.send(f"🗑 Удалено: {removed_song.title}")
+
+@commands.command(name="move", help="Перемещает трек в очереди. Пример: !move <откуда> <куда>")
+async def move(ctx, src: int, dst: int):
+    """Перемещает трек на другую позицию в очереди"""
+    player = get_player(ctx.guild)
+    if 0 < src <= len(player.queue) and 0 < dst <= len(player.queue):
+        player.queue.move(src - 1, dst - 1)
+        queue_changed(player)
+        await ctx.send(f"↕️ Перемещено: {player.queue[dst - 1].title} → позиция {dst}")
+
+@commands.command(name="shuffle", help="Перемешивает очередь треков.")
+async def shuffle(ctx):
+    """Перемешивает очередь треков"""
+    player = get_player(ctx.guild)
+    if player.queue:
+        player.queue.shuffle()
+        queue_changed(player)
+        await ctx.send("🔀 Очередь перемешана!")
+    else:
+        await ctx.send("📭 Очередь пуста!")
 
-@bot.command(name="clear", help="Очищает очередь треков.")
+@commands.command(name="clear", help="Очищает очередь треков.")
 async def clear(ctx):
     """Очищает очередь треков"""
-    guild_id = ctx.guild.id
-    if guild_id in song_queue:
-        song_queue[guild_id] = []
+    player = get_player(ctx.guild)
+    if player.queue:
+        player.clear()
+        queue_changed(player)
         await ctx.send("🧹 Очередь очищена!")
     else:
         await ctx.send("📭 Очередь уже пуста!")
 
+COMMANDS = [play, skip, queue, pause, resume, stop, remove, move, shuffle, clear]
+
+warm_up_task = None
+
+async def warm_up(bot):
+    """Когда бот уже подключён, заранее импортирует yt-dlp и собирает клиент YouTube API"""
+    await bot.wait_until_ready()
+    get_extractor_pool().start()
+    try:
+        await get_youtube_search().warm_up()
+    except Exception as e:
+        print(f"Ошибка при подготовке клиента YouTube: {str(e)}")
+
+async def setup(bot):
+    """Точка входа расширения: регистрирует музыкальные команды в боте"""
+    global voice_manager, warm_up_task, search_cache_task, edit_scheduler
+    voice_manager = get_voice_manager(bot)
+    processes = getattr(bot, "process_count", 1)
+    edit_scheduler = EditScheduler(global_rate=(max(1, EDIT_GLOBAL_RATE[0] // processes), EDIT_GLOBAL_RATE[1]))
+    for command in COMMANDS:
+        bot.add_command(command)
+    # Подключение к Discord не ждёт тяжёлых импортов
+    warm_up_task = asyncio.create_task(warm_up(bot))
+    log_search_cache_stats()
+    if SEARCH_CACHE_PATH:
+        search_cache_task = asyncio.create_task(flush_search_cache())
+
+async def teardown(bot):
+    for command in COMMANDS:
+        bot.remove_command(command.name)
+    if search_cache_task:
+        search_cache_task.cancel()
+    if search_cache.dirty:
+        await asyncio.get_running_loop().run_in_executor(None, search_cache.save)
+    log_search_cache_stats()
+
+def create_bot():
+    """Отдельный бот только с музыкой; общий бот собирается в german_bot.py"""
+    intents = discord.Intents.default()
+    intents.message_content = True
+    bot = commands.Bot(command_prefix="!", intents=intents)
+    bot.setup_hook = lambda: setup(bot)
+    return bot
+
 if __name__ == '__main__':
-    bot.run(TOKEN)
+    create_bot().run(TOKEN)
@@ -5,60 +5,162 @@ from discord import FFmpegPCMAudio
 from discord.ext import commands
 
 from _token import TOKEN
+from services.audio import OpusPacketSource, encode_opus_packets
+from services.voice_manager import GREETER, get_voice_manager
 
-# Инициализация бота
-intents = discord.Intents.default()
-intents.voice_states = True
-intents.guilds = True
-intents.members = True
-intents.messages = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Голосовые подключения общие с музыкальным модулем, задаётся в setup()
+voice_manager = None
 
-voice_clients = {}
+WELCOME_FILE = "welcome.mp3"
+welcome_packets = None  # Приветствие, заранее закодированное в Opus-пакеты
 
+# Заходы в течение этого окна (в секундах) объединяются в одно приветствие
+GREETING_DEBOUNCE = 2.0
+# Сколько секунд держать подключение после приветствия, None - не отключаться
+VOICE_IDLE_TIMEOUT = 5 * 60
+# Сколько секунд приветствие ждёт, пока музыка освободит подключение
+GREETING_MAX_WAIT = 30
 
-def play_audio(vc, file_path, guild_id):
+greeting_channels = {}  # guild_id -> канал, в который зашли последним
+greeting_tasks = {}  # guild_id -> приветствие текущей волны заходов
+idle_tasks = {}  # guild_id -> отложенное отключение
+welcome_task = None
+
+
+async def prepare_welcome():
+    """Кодирует приветствие один раз при запуске, а не на каждый заход в канал"""
+    global welcome_packets
+    try:
+        welcome_packets = await asyncio.get_running_loop().run_in_executor(None, encode_opus_packets, WELCOME_FILE)
+    except Exception as e:
+        print(f"Не удалось подготовить приветствие, будет использоваться FFmpeg: {e}")
+
+
+def play_audio(vc, file_path, guild):
     def after_playback(error):
-        if guild_id in voice_clients:
-            asyncio.run_coroutine_threadsafe(voice_clients[guild_id].disconnect(), bot.loop)
-            del voice_clients[guild_id]
+        # Не отключаемся сразу: следующий заход не будет ждать подключения
+        vc.loop.call_soon_threadsafe(schedule_disconnect, guild)
 
-    source = FFmpegPCMAudio(file_path)
+    if welcome_packets and file_path == WELCOME_FILE:
+        source = OpusPacketSource(welcome_packets)
+    else:
+        source = FFmpegPCMAudio(file_path)
     vc.play(source, after=after_playback)
 
 
-@bot.event
+def cancel_disconnect(guild_id):
+    task = idle_tasks.pop(guild_id, None)
+    if task:
+        task.cancel()
+
+
+def schedule_disconnect(guild):
+    """Отключается от канала, если за VOICE_IDLE_TIMEOUT никто больше не зашёл"""
+    cancel_disconnect(guild.id)
+    if VOICE_IDLE_TIMEOUT is not None:
+        idle_tasks[guild.id] = asyncio.create_task(disconnect_when_idle(guild))
+
+
+async def disconnect_when_idle(guild):
+    await asyncio.sleep(VOICE_IDLE_TIMEOUT)
+    idle_tasks.pop(guild.id, None)
+    vc = guild.voice_client
+    if (vc and vc.is_playing()) or guild.id in greeting_tasks:
+        return
+    # Если подключение забрала музыка, оно остаётся ей
+    if voice_manager.release(guild.id, GREETER):
+        await voice_manager.disconnect(guild)
+
+
+async def greet(guild):
+    """Одно приветствие на волну заходов; подключение идёт, пока копятся события"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + GREETING_DEBOUNCE
+    try:
+        cancel_disconnect(guild.id)
+        # Музыка важнее: пока она занимает подключение, приветствие ждёт своей очереди
+        if not await voice_manager.wait_available(guild.id, GREETER, GREETING_MAX_WAIT):
+            return
+        if not await voice_manager.connect(greeting_channels[guild.id], GREETER):
+            return
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+        # Заходы после этого момента начнут новую волну
+        greeting_tasks.pop(guild.id, None)
+        # За время окна могли зайти в другой канал - приветствуем последний
+        vc = await voice_manager.connect(greeting_channels.pop(guild.id), GREETER)
+        if not vc or vc.is_playing():
+            return
+        play_audio(vc, WELCOME_FILE, guild)
+    except Exception as e:
+        print(f"Ошибка при приветствии: {e}")
+        schedule_disconnect(guild)
+    finally:
+        if greeting_tasks.get(guild.id) is asyncio.current_task():
+            del greeting_tasks[guild.id]
+            greeting_channels.pop(guild.id, None)
+
+
 async def on_voice_state_update(member, before, after):
     if after.channel and not before.channel:  # Пользователь зашел в канал
         channel = after.channel
-        if member != bot.user:
-            if channel.guild.id not in voice_clients:
-                vc = await channel.connect()
-                voice_clients[channel.guild.id] = vc
-            else:
-                vc = voice_clients[channel.guild.id]
-            play_audio(vc, "welcome.mp3", channel.guild.id)
+        if member != channel.guild.me:
+            guild = channel.guild
+            greeting_channels[guild.id] = channel
+            if guild.id not in greeting_tasks:
+                greeting_tasks[guild.id] = asyncio.create_task(greet(guild))
 
 
-@bot.command()
+@commands.command()
 async def join(ctx):
     if ctx.author.voice:
         channel = ctx.author.voice.channel
-        if ctx.guild.id not in voice_clients:
-            vc = await channel.connect()
-            voice_clients[ctx.guild.id] = vc
-        await ctx.send("Подключился к голосовому каналу!")
+        cancel_disconnect(ctx.guild.id)
+        if await voice_manager.connect(channel, GREETER):
+            await ctx.send("Подключился к голосовому каналу!")
+        else:
+            await ctx.send("Сейчас играет музыка, подключение занято!")
     else:
         await ctx.send("Ты должен быть в голосовом канале!")
 
 
-@bot.command()
+@commands.command()
 async def leave(ctx):
-    if ctx.guild.id in voice_clients:
-        await voice_clients[ctx.guild.id].disconnect()
-        del voice_clients[ctx.guild.id]
+    if ctx.voice_client and voice_manager.release(ctx.guild.id, GREETER):
+        cancel_disconnect(ctx.guild.id)
+        await voice_manager.disconnect(ctx.guild)
         await ctx.send("Отключился от голосового канала!")
 
 
+async def setup(bot):
+    """Точка входа расширения: приветствие при заходе в голосовой канал"""
+    global voice_manager, welcome_task
+    voice_manager = get_voice_manager(bot)
+    # Кодирование идёт в фоне, чтобы не задерживать подключение к Discord;
+    # до его окончания приветствие проигрывается через FFmpeg
+    welcome_task = asyncio.create_task(prepare_welcome())
+    bot.add_listener(on_voice_state_update)
+    bot.add_command(join)
+    bot.add_command(leave)
+
+
+async def teardown(bot):
+    bot.remove_listener(on_voice_state_update)
+    bot.remove_command(join.name)
+    bot.remove_command(leave.name)
+
+
+def create_bot():
+    """Отдельный бот только с приветствием; общий бот собирается в german_bot.py"""
+    intents = discord.Intents.default()
+    intents.voice_states = True
+    intents.guilds = True
+    intents.members = True
+    intents.messages = True
+    bot = commands.Bot(command_prefix="!", intents=intents)
+    bot.setup_hook = lambda: setup(bot)
+    return bot
+
+
 if __name__ == "__main__":
-    bot.run(TOKEN)
+    create_bot().run(TOKEN)
@@ -0,0 +1,26 @@
+from .audio import OpusPacketSource, PrebufferedSource, encode_opus_packets
+from .edit_scheduler import EditScheduler
+from .extractor_pool import ExtractorPool
+from .guild_player import GuildPlayer
+from .search_cache import SearchCache
+from .stream_cache import StreamCache
+from .track_queue import QueueEntry, TrackQueue
+from .track_store import TrackStore
+from .voice_manager import VoiceManager
+from .youtube_search import YouTubeSearchClient
+
+__all__ = [
+    'EditScheduler',
+    'ExtractorPool',
+    'GuildPlayer',
+    'OpusPacketSource',
+    'PrebufferedSource',
+    'QueueEntry',
+    'SearchCache',
+    'StreamCache',
+    'TrackQueue',
+    'TrackStore',
+    'VoiceManager',
+    'YouTubeSearchClient',
+    'encode_opus_packets'
+]
\ No newline at end of file
@@ -0,0 +1,84 @@
+import threading
+from collections import deque
+from typing import List
+
+import discord
+
+
+class PrebufferedSource(discord.AudioSource):
+    """Обёртка над источником, которая заранее читает первые кадры в фоне.
+
+    Нужна для бесшовного переключения треков: FFmpeg запускается и успевает
+    подключиться и набрать буфер до того, как закончится текущий трек.
+    Как только плеер начинает читать, предзагрузка останавливается.
+    """
+
+    def __init__(self, original: discord.AudioSource, frames: int = 150):
+        self.original = original
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._started = False
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(frames,), name="audio-prebuffer", daemon=True)
+        self._thread.start()
+
+    def _fill(self, frames: int):
+        while len(self._buffer) < frames:
+            with self._lock:
+                if self._started:
+                    return
+                data = self.original.read()
+                if not data:
+                    self._eof = True
+                    return
+                self._buffer.append(data)
+
+    def read(self) -> bytes:
+        with self._lock:
+            self._started = True
+            if self._buffer:
+                return self._buffer.popleft()
+            if self._eof:
+                return b''
+            return self.original.read()
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self):
+        # Без блокировки: фоновый поток может ждать данных от FFmpeg,
+        # а остановка процесса как раз прервёт это ожидание
+        self._started = True
+        self.original.cleanup()
+
+
+def encode_opus_packets(file_path: str) -> List[bytes]:
+    """Один раз прогоняет файл через FFmpeg и возвращает готовые Opus-пакеты по 20 мс"""
+    source = discord.FFmpegOpusAudio(file_path)
+    try:
+        return list(iter(source.read, b''))
+    finally:
+        source.cleanup()
+
+
+class OpusPacketSource(discord.AudioSource):
+    """Проигрывает заранее закодированные Opus-пакеты из памяти.
+
+    Без FFmpeg и без кодирования: плеер просто отдаёт пакеты в Discord.
+    Список пакетов не меняется, поэтому один и тот же список можно
+    одновременно проигрывать на нескольких серверах.
+    """
+
+    def __init__(self, packets: List[bytes]):
+        self.packets = packets
+        self._index = 0
+
+    def read(self) -> bytes:
+        if self._index >= len(self.packets):
+            return b''
+        packet = self.packets[self._index]
+        self._index += 1
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
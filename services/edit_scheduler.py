@@ -0,0 +1,111 @@
+import asyncio
+import time
+from typing import Dict, Tuple
+
+import discord
+
+
+class _Bucket:
+    """Токен-бакет: capacity запросов за per секунд"""
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.per = per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующего свободного токена"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.capacity
+
+    def take(self):
+        self.tokens -= 1
+
+
+class EditScheduler:
+    """Общий планировщик редактирования сообщений.
+
+    Правки одного сообщения объединяются: пока правка ждёт своей очереди,
+    новые поля просто заменяют старые, и в Discord уходит только последнее
+    состояние. Отправка идёт с оглядкой на лимиты: не больше channel_rate
+    правок на канал и global_rate правок на бота, поэтому 429 почти не
+    случаются и не задерживают ответы на команды.
+    refresh_interval подстраивает период фоновых обновлений под число
+    активных плееров. discord.py сам ждёт и повторяет запросы с ответом 429,
+    так что до _send они доходят только после исчерпания его повторов; на
+    этот редкий случай период фоновых обновлений дополнительно растёт.
+    """
+
+    def __init__(self, channel_rate: Tuple[int, float] = (5, 5.0), global_rate: Tuple[int, float] = (40, 1.0),
+                 base_interval: float = 5.0, max_interval: float = 60.0, periodic_share: float = 0.5):
+        self.channel_rate = channel_rate
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.periodic_share = periodic_share  # Доля глобального лимита для фоновых обновлений
+        self._global = _Bucket(*global_rate)
+        self._channels: Dict[int, _Bucket] = {}
+        self._pending: Dict[int, Tuple[discord.Message, dict]] = {}  # id сообщения -> (сообщение, поля)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._periodic = set()  # Кто сейчас периодически обновляет сообщения
+        self._backoff = 1.0  # Растёт после 429, дошедшего сквозь повторы discord.py
+
+    @property
+    def refresh_interval(self) -> float:
+        """Период фоновых обновлений с учётом нагрузки"""
+        budget = self._global.capacity / self._global.per * self.periodic_share
+        interval = max(self.base_interval, len(self._periodic) / budget) * self._backoff
+        return min(interval, self.max_interval)
+
+    def register(self, owner):
+        self._periodic.add(owner)
+
+    def unregister(self, owner):
+        self._periodic.discard(owner)
+
+    def submit(self, message: discord.Message, **fields):
+        """Ставит правку в очередь; поля объединяются с ещё не отправленной правкой"""
+        pending = self._pending.get(message.id)
+        if pending:
+            pending[1].update(fields)
+        else:
+            self._pending[message.id] = (message, fields)
+        if message.id not in self._tasks:
+            self._tasks[message.id] = asyncio.create_task(self._flush(message.id))
+
+    async def _flush(self, message_id: int):
+        try:
+            while message_id in self._pending:
+                message = self._pending[message_id][0]
+                channel = self._channels.get(message.channel.id)
+                if channel is None:
+                    channel = self._channels[message.channel.id] = _Bucket(*self.channel_rate)
+                delay = max(channel.delay(), self._global.delay())
+                if delay > 0:
+                    # Пока ждём, правка может обновиться - отправится последняя
+                    await asyncio.sleep(delay)
+                    continue
+
+                channel.take()
+                self._global.take()
+                message, fields = self._pending.pop(message_id)
+                await self._send(message, fields)
+        finally:
+            self._tasks.pop(message_id, None)
+
+    async def _send(self, message: discord.Message, fields: dict):
+        try:
+            await message.edit(**fields)
+            self._backoff = max(1.0, self._backoff * 0.9)
+        except discord.NotFound:
+            self._pending.pop(message.id, None)  # Сообщение удалили
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self._backoff = min(self._backoff * 2, self.max_interval / self.base_interval)
+            print(f"Ошибка при редактировании сообщения: {e}")
+        except Exception as e:
+            print(f"Ошибка при редактировании сообщения: {e}")
@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Приоритеты задач: чем меньше число, тем раньше задача будет выполнена
+PRIORITY_PLAY = 0  # Трек нужен прямо сейчас
+PRIORITY_METADATA = 1  # Пользователь ждёт ответа на команду
+PRIORITY_BACKGROUND = 2  # Предзагрузка и фоновые обновления
+
+
+class _Job:
+    __slots__ = ("func", "profile", "future", "loop", "priority", "key", "started")
+
+    def __init__(self, func, profile: str, future: asyncio.Future, loop: asyncio.AbstractEventLoop,
+                 priority: int, key: Optional[Hashable] = None):
+        self.func = func
+        self.profile = profile
+        self.future = future
+        self.loop = loop
+        self.priority = priority
+        self.key = key
+        self.started = False
+
+    def resolve(self, result=None, error: Optional[BaseException] = None):
+        def apply():
+            if self.future.done():  # Задачу уже отменили или она истекла
+                return
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(result)
+        self.loop.call_soon_threadsafe(apply)
+
+
+class ExtractorPool:
+    """Пул потоков для yt-dlp с очередью приоритетов.
+
+    profiles - именованные наборы опций YoutubeDL: дешёвое получение
+    метаданных, разрешение стрима, перечисление плейлиста. У каждого потока
+    свой экземпляр YoutubeDL на каждый профиль (он не потокобезопасен),
+    экземпляры создаются при первом использовании и переиспользуются.
+    Сам yt_dlp импортируется только в потоках пула.
+    Задачи "играть сейчас" обгоняют фоновую предзагрузку, а приоритет ещё
+    не начатой задачи можно поднять через promote(). Если ожидающая
+    корутина отменена или истёк таймаут до начала выполнения, задача
+    пропускается; уже запущенное извлечение доводится до конца, а его
+    результат отбрасывается.
+    """
+
+    def __init__(self, profiles: Dict[str, Dict], workers: int = 3, timeout: float = 60):
+        self.profiles = profiles
+        self.workers = workers
+        self.timeout = timeout
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._waiting: Dict[Hashable, _Job] = {}  # key -> ещё не начатая задача
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"extractor-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def start(self):
+        """Запускает потоки заранее, например сразу после подключения бота"""
+        self._ensure_started()
+
+    def _worker(self):
+        import yt_dlp  # Импорт долгий, поэтому он идёт в потоке пула, а не при запуске бота
+
+        instances = {}
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                break
+            with self._lock:
+                # После promote() задача лежит в очереди дважды, выполняется первая копия
+                if job.started:
+                    continue
+                job.started = True
+                if job.key is not None and self._waiting.get(job.key) is job:
+                    del self._waiting[job.key]
+            if job.future.done():
+                continue
+            try:
+                ydl = instances.get(job.profile)
+                if ydl is None:
+                    ydl = instances[job.profile] = yt_dlp.YoutubeDL(self.profiles[job.profile])
+                job.resolve(job.func(ydl))
+            except Exception as e:
+                job.resolve(error=e)
+
+    async def run(self, func: Callable[[Any], Any], profile: str, priority: int = PRIORITY_PLAY,
+                  timeout: Optional[float] = None, key: Optional[Hashable] = None) -> Any:
+        """Выполняет func(ydl) в одном из потоков пула с YoutubeDL нужного профиля.
+
+        timeout=None - таймаут пула по умолчанию, 0 - без ограничения (для
+        долгих задач вроде постраничного чтения плейлиста).
+        key - по нему promote() находит задачу, пока она ждёт в очереди.
+        """
+        if profile not in self.profiles:
+            raise KeyError(f"Неизвестный профиль yt-dlp: {profile}")
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        job = _Job(func, profile, loop.create_future(), loop, priority, key)
+        if key is not None:
+            with self._lock:
+                self._waiting[key] = job
+        self._queue.put((priority, next(self._counter), job))
+        if timeout == 0:
+            return await job.future
+        return await asyncio.wait_for(job.future, timeout=timeout or self.timeout)
+
+    async def extract_info(self, url: str, profile: str, priority: int = PRIORITY_PLAY,
+                           timeout: Optional[float] = None, key: Optional[Hashable] = None,
+                           **kwargs) -> Optional[Dict]:
+        return await self.run(
+            lambda ydl: ydl.extract_info(url, download=False, **kwargs),
+            profile,
+            priority=priority,
+            timeout=timeout,
+            key=key
+        )
+
+    def promote(self, key: Hashable, priority: int) -> bool:
+        """Поднимает приоритет задачи, которую пул ещё не начал выполнять.
+
+        Задача кладётся в очередь ещё раз с новым приоритетом, старая копия
+        будет пропущена. False - задачи нет или она уже выполняется.
+        """
+        with self._lock:
+            job = self._waiting.get(key)
+            if job is None or job.started or job.future.done() or job.priority <= priority:
+                return False
+            job.priority = priority
+            self._queue.put((priority, next(self._counter), job))
+        return True
+
+    def close(self):
+        """Останавливает потоки после того, как они доработают уже взятые задачи"""
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._counter), None))
+        self._threads = []
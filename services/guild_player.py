@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from .track_queue import QueueEntry, TrackQueue
+
+
+class GuildPlayer:
+    """Состояние музыкального плеера одного сервера.
+
+    Всё, что раньше хранилось в глобальных словарях и в общем current_view,
+    живёт здесь, поэтому серверы не мешают друг другу. В queue лежат только
+    предстоящие треки, текущий хранится отдельно в current.
+    """
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.queue = TrackQueue()
+        self.current: Optional[QueueEntry] = None  # Текущий трек
+        self.current_track: Optional[Tuple] = None  # (stream_url, title, duration, thumbnail_url, codec)
+        self.view = None  # MusicPlayerView текущего трека
+        self.loop = False  # Повтор текущего трека
+        self.preloads: Dict[str, asyncio.Task] = {}  # url -> задача предзагрузки
+        self.preload_version = -1  # Версия очереди, для которой строилось окно предзагрузки
+        self.prepared: Optional[Tuple] = None  # (QueueEntry, source, track) для бесшовного переключения
+        self._prepared_lock = threading.Lock()  # prepared забирает и поток плеера, и event loop
+        self.gapless_task: Optional[asyncio.Task] = None
+        self.stream_retries = 0  # Сколько раз подряд текущий трек обрывался
+        self.starting = False  # play_next сейчас запускает трек
+        self.ingestions: Set[Tuple[asyncio.Task, threading.Event]] = set()  # Фоновые загрузки плейлистов
+
+    @property
+    def guild_id(self) -> int:
+        return self.guild.id
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    @property
+    def idle(self) -> bool:
+        """Ничего не играет и play_next не запускает трек прямо сейчас"""
+        return self.current is None and not self.starting
+
+    def next_entry(self) -> Optional[QueueEntry]:
+        """Трек, который заиграет после текущего"""
+        if self.loop and self.current:
+            return self.current
+        if self.queue:
+            return self.queue[0]
+        return None
+
+    def take_prepared(self) -> Optional[Tuple]:
+        """Забирает подготовленный трек; получить его может только кто-то один"""
+        with self._prepared_lock:
+            prepared, self.prepared = self.prepared, None
+        return prepared
+
+    def discard_prepared(self):
+        """Останавливает FFmpeg подготовленного, но не понадобившегося трека"""
+        prepared = self.take_prepared()
+        if prepared:
+            prepared[1].cleanup()
+
+    def check_prepared(self):
+        """Выбрасывает подготовленный трек, если после изменений следующим будет другой"""
+        prepared = self.prepared
+        if prepared and prepared[0] is not self.next_entry():
+            self.discard_prepared()
+
+    def set_view(self, view):
+        if self.view:
+            self.view.stop_updates()
+        self.view = view
+
+    def cancel_ingestions(self):
+        """Останавливает загрузку плейлистов, которые ещё дописываются в очередь"""
+        for task, cancel_event in self.ingestions:
+            cancel_event.set()
+            task.cancel()
+        self.ingestions.clear()
+
+    def clear(self):
+        """Очищает очередь и всё, что было подготовлено для неё заранее"""
+        self.cancel_ingestions()
+        self.queue.clear()
+        for task in self.preloads.values():
+            task.cancel()
+        self.preloads.clear()
+        self.discard_prepared()
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class SearchCache:
+    """LRU-кэш результатов текстового поиска с ограничением по времени жизни.
+
+    Ключ - нормализованный запрос, так что "Rammstein  Du Hast" и
+    "rammstein du hast" попадают в одну запись. Если указан persist_path,
+    кэш загружается с диска при создании и сохраняется методом save().
+    dirty показывает, что с последнего сохранения появились новые записи.
+    Файл могут делить несколько процессов: перед записью save() добавляет
+    к своим записям те, что другие процессы уже сохранили в файл.
+    """
+
+    FORMAT_VERSION = 2  # Меняется, когда меняется формат результатов поиска
+
+    def __init__(self, max_size: int = 512, ttl: float = 6 * 3600, persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._entries = OrderedDict()  # query -> (expires_at, results)
+        self._lock = threading.Lock()
+        if persist_path:
+            self.load()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def get(self, query: str) -> Optional[List[Dict]]:
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, query: str, results: List[Dict]):
+        key = self.normalize(query)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.dirty = True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _read_file(self) -> List:
+        """Записи из файла [[key, expires_at, results], ...]; пусто, если файла нет"""
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+
+        if data.get("version", 1) != self.FORMAT_VERSION:
+            return []  # Результаты в старом формате проще запросить заново
+        return data.get("entries", [])
+
+    def _merge(self, stored: List):
+        """Добавляет записи с диска как более старые; свежие записи памяти не затираются.
+
+        Вызывается под self._lock.
+        """
+        now = time.time()
+        merged = OrderedDict()
+        for key, expires_at, results in stored:
+            current = self._entries.get(key)
+            if expires_at > now and (current is None or current[0] < expires_at):
+                merged[key] = (expires_at, results)
+        for key, entry in self._entries.items():
+            if key not in merged:
+                merged[key] = entry
+        while len(merged) > self.max_size:
+            merged.popitem(last=False)
+        self._entries = merged
+
+    def load(self):
+        """Загружает непросроченные записи с диска"""
+        stored = self._read_file()
+        with self._lock:
+            self._merge(stored)
+
+    def save(self):
+        """Атомарно сохраняет кэш на диск (можно вызывать из пула потоков)"""
+        if not self.persist_path:
+            return
+        stored = self._read_file()
+        with self._lock:
+            self._merge(stored)
+            entries = [[key, expires_at, results] for key, (expires_at, results) in self._entries.items()]
+            self.dirty = False
+
+        # Свой временный файл у каждого потока и процесса (шарды делят один кэш)
+        tmp_path = f"{self.persist_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.FORMAT_VERSION, "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            self.dirty = True  # Попробуем в следующий раз
+            print(f"Ошибка при сохранении кэша поиска: {e}")
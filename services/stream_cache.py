@@ -0,0 +1,105 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .extractor_pool import PRIORITY_BACKGROUND, PRIORITY_PLAY
+
+EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+
+def parse_stream_expiry(stream_url: str) -> Optional[float]:
+    """Возвращает время истечения ссылки googlevideo (параметр expire=) или None"""
+    match = EXPIRE_RE.search(stream_url or "")
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class StreamCache:
+    """Кэш разрешённых ссылок на аудио-стримы.
+
+    Ссылки googlevideo содержат время истечения в параметре expire=.
+    Запись отдаётся из кэша, пока до истечения больше expiry_margin секунд.
+    Если до истечения осталось меньше refresh_ahead секунд, запись всё ещё
+    отдаётся, но в фоне запускается её обновление. Одновременные запросы
+    одного и того же трека объединяются в одно извлечение; если трек
+    понадобился с более высоким приоритетом, чем у уже ждущего извлечения,
+    вызывается promoter(url, priority), чтобы оно не стояло за фоновыми.
+    """
+
+    def __init__(self, resolver: Callable[[str, int], Awaitable[Tuple]], key_func: Callable[[str], str] = None,
+                 max_size: int = 256, expiry_margin: float = 60, refresh_ahead: float = 15 * 60,
+                 default_ttl: float = 30 * 60, promoter: Optional[Callable[[str, int], bool]] = None):
+        self.resolver = resolver
+        self.key_func = key_func or (lambda url: url)
+        self.promoter = promoter
+        self.max_size = max_size
+        self.expiry_margin = expiry_margin
+        self.refresh_ahead = refresh_ahead
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._pending = {}  # key -> asyncio.Task
+        self._requests = {}  # key -> (url, priority) для _pending
+        self._waiters = {}  # key -> сколько корутин ждут этот _pending
+
+    async def get(self, url: str, priority: int = PRIORITY_PLAY) -> Tuple:
+        """Возвращает (stream_url, title, duration, thumbnail_url, codec), при необходимости извлекая заново"""
+        key = self.key_func(url)
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry and entry[0] - self.expiry_margin > now:
+            self._entries.move_to_end(key)
+            if entry[0] - self.refresh_ahead <= now and key not in self._pending:
+                self._start_resolve(key, url, PRIORITY_BACKGROUND).add_done_callback(self._on_refresh_done)
+            return entry[1]
+
+        task = self._start_resolve(key, url, priority)
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def invalidate(self, url: str):
+        self._entries.pop(self.key_func(url), None)
+
+    def cancel(self, url: str):
+        """Отменяет извлечение, если его результат больше никто не ждёт"""
+        key = self.key_func(url)
+        task = self._pending.get(key)
+        if task and not self._waiters.get(key):
+            task.cancel()
+
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            print(f"Ошибка при фоновом обновлении стрима: {task.exception()}")
+
+    def _start_resolve(self, key: str, url: str, priority: int) -> asyncio.Task:
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve(key, url, priority))
+            self._pending[key] = task
+            self._requests[key] = (url, priority)
+        else:
+            pending_url, pending_priority = self._requests[key]
+            if priority < pending_priority and self.promoter and self.promoter(pending_url, priority):
+                self._requests[key] = (pending_url, priority)
+        return task
+
+    async def _resolve(self, key: str, url: str, priority: int) -> Tuple:
+        try:
+            result = await self.resolver(url, priority)
+            expires_at = parse_stream_expiry(result[0]) or time.time() + self.default_ttl
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return result
+        finally:
+            self._pending.pop(key, None)
+            self._requests.pop(key, None)
@@ -0,0 +1,233 @@
+import random
+from typing import Iterable, Iterator, List, Optional
+
+
+class QueueEntry:
+    """Трек в очереди"""
+    __slots__ = ("url", "title", "video_id", "duration", "requester")
+
+    def __init__(self, url: str, title: str, video_id: Optional[str] = None, duration: Optional[int] = None,
+                 requester: Optional[int] = None):
+        self.url = url
+        self.title = title
+        self.video_id = video_id
+        self.duration = duration
+        self.requester = requester  # ID пользователя, добавившего трек
+
+
+class TrackQueue:
+    """Очередь треков для больших плейлистов.
+
+    Элементы хранятся блоками примерно по BLOCK_SIZE, размеры блоков
+    учитываются в дереве Фенвика, поэтому поиск позиции занимает O(log n),
+    а вставка, удаление и перемещение по индексу - O(log n + BLOCK_SIZE).
+    Когда блок делится, пустеет или сливается с соседом, дерево строится
+    заново за O(n / BLOCK_SIZE); между такими перестройками проходит порядка
+    BLOCK_SIZE операций над блоком. Блоки меньше BLOCK_SIZE / 4 сливаются
+    с соседями, так что после множества удалений очередь не распадается
+    на блоки из одного трека.
+    Снятие трека с начала очереди - O(1) (и O(n / BLOCK_SIZE), когда
+    первый блок кончается): первый блок не сдвигается, растёт смещение _head.
+    version увеличивается при каждом изменении, по нему предзагрузка и
+    view дёшево понимают, что очередь поменялась.
+    total_duration - суммарная длительность треков, она пересчитывается
+    при каждом изменении, а не обходом очереди; треки с неизвестной
+    длительностью считаются в unknown_durations.
+    """
+
+    BLOCK_SIZE = 64
+
+    def __init__(self, entries: Iterable[QueueEntry] = ()):
+        self._blocks: List[List[Optional[QueueEntry]]] = []
+        self._head = 0  # Сколько элементов уже снято с начала первого блока
+        self._tree: List[int] = [0]  # Дерево Фенвика по размерам блоков (с 1)
+        self._len = 0
+        self.version = 0
+        self.total_duration = 0
+        self.unknown_durations = 0
+        self.extend(entries)
+
+    # --- Дерево Фенвика ---
+
+    def _rebuild(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, block_index: int, delta: int):
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _tree_append(self, size: int):
+        # Новый узел i покрывает блоки (i - lowbit(i), i]
+        i = len(self._tree)
+        low = i - (i & -i)
+        total = size
+        j = i - 1
+        while j > low:
+            total += self._tree[j]
+            j -= j & -j
+        self._tree.append(total)
+
+    def _locate(self, index: int):
+        """Возвращает (номер блока, позиция в блоке) для индекса очереди"""
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("индекс вне очереди")
+        pos = index + self._head
+        block_index = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = block_index + step
+            if nxt < len(self._tree) and self._tree[nxt] <= pos:
+                block_index = nxt
+                pos -= self._tree[nxt]
+            step >>= 1
+        return block_index, pos
+
+    def _block_len(self, block_index: int) -> int:
+        """Сколько треков реально лежит в блоке (без уже снятых с начала)"""
+        return len(self._blocks[block_index]) - (self._head if block_index == 0 else 0)
+
+    def _merge_small(self, block_index: int) -> bool:
+        """Сливает маленький блок с соседом; False - сливать не с чем или некуда"""
+        if self._block_len(block_index) >= self.BLOCK_SIZE // 4 or len(self._blocks) < 2:
+            return False
+        left = block_index if block_index + 1 < len(self._blocks) else block_index - 1
+        if self._block_len(left) + self._block_len(left + 1) > self.BLOCK_SIZE:
+            return False
+        if left == 0 and self._head:
+            del self._blocks[0][:self._head]
+            self._head = 0
+        self._blocks[left].extend(self._blocks[left + 1])
+        del self._blocks[left + 1]
+        self._rebuild()
+        return True
+
+    def _count(self, entry: QueueEntry, sign: int):
+        if entry.duration:
+            self.total_duration += sign * entry.duration
+        else:
+            self.unknown_durations += sign
+
+    # --- Операции очереди ---
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[QueueEntry]:
+        for i, block in enumerate(self._blocks):
+            yield from (block[self._head:] if i == 0 else block)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        block_index, pos = self._locate(index)
+        return self._blocks[block_index][pos]
+
+    def append(self, entry: QueueEntry):
+        if not self._blocks or len(self._blocks[-1]) >= self.BLOCK_SIZE:
+            self._blocks.append([entry])
+            self._tree_append(1)
+        else:
+            self._blocks[-1].append(entry)
+            self._tree_add(len(self._blocks) - 1, 1)
+        self._len += 1
+        self._count(entry, 1)
+        self.version += 1
+
+    def extend(self, entries: Iterable[QueueEntry]):
+        for entry in entries:
+            self.append(entry)
+
+    def popleft(self) -> QueueEntry:
+        if not self._len:
+            raise IndexError("очередь пуста")
+        block = self._blocks[0]
+        entry = block[self._head]
+        block[self._head] = None  # Не держим ссылку на снятый трек
+        self._head += 1
+        self._len -= 1
+        if self._head == len(block):
+            del self._blocks[0]
+            self._head = 0
+            self._rebuild()
+        self._count(entry, -1)
+        self.version += 1
+        return entry
+
+    def pop(self, index: int = -1) -> QueueEntry:
+        if index == 0 or index == -self._len:
+            return self.popleft()
+        block_index, pos = self._locate(index)
+        block = self._blocks[block_index]
+        entry = block.pop(pos)
+        self._len -= 1
+        if len(block) == (self._head if block_index == 0 else 0):
+            del self._blocks[block_index]
+            if block_index == 0:
+                self._head = 0
+            self._rebuild()
+        elif not self._merge_small(block_index):
+            self._tree_add(block_index, -1)
+        self._count(entry, -1)
+        self.version += 1
+        return entry
+
+    def insert(self, index: int, entry: QueueEntry):
+        if index < 0:
+            index = max(0, index + self._len)
+        if index >= self._len:
+            self.append(entry)
+            return
+        block_index, pos = self._locate(index)
+        block = self._blocks[block_index]
+        block.insert(pos, entry)
+        self._len += 1
+        if len(block) > 2 * self.BLOCK_SIZE:
+            # Делим разросшийся блок пополам
+            if block_index == 0:
+                del block[:self._head]
+                self._head = 0
+            half = len(block) // 2
+            self._blocks.insert(block_index + 1, block[half:])
+            del block[half:]
+            self._rebuild()
+        else:
+            self._tree_add(block_index, 1)
+        self._count(entry, 1)
+        self.version += 1
+
+    def remove(self, entry: QueueEntry) -> bool:
+        """Удаляет именно этот трек (по идентичности); False - его уже нет в очереди"""
+        for i, item in enumerate(self):
+            if item is entry:
+                self.pop(i)
+                return True
+        return False
+
+    def move(self, src: int, dst: int):
+        """Переносит трек с позиции src на позицию dst"""
+        self.insert(dst, self.pop(src))
+
+    def shuffle(self):
+        entries = list(self)
+        random.shuffle(entries)
+        self.clear()
+        self.extend(entries)
+
+    def clear(self):
+        self._blocks = []
+        self._head = 0
+        self._tree = [0]
+        self._len = 0
+        self.total_duration = 0
+        self.unknown_durations = 0
+        self.version += 1
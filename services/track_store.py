@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class TrackStore:
+    """Локальный индекс метаданных треков (SQLite), ключ - 11-символьный ID видео.
+
+    Хранит только долговечные данные: название, длительность и превью.
+    Ссылки на аудио-стрим живут недолго и сюда не попадают.
+    Запись синхронная, поэтому из event loop её лучше вызывать через
+    run_in_executor; put_many пишет пачку записей одной транзакцией.
+    """
+
+    def __init__(self, path: str = "tracks.db"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # С WAL это не портит базу при сбое, а fsync на каждый коммит не нужен:
+            # в худшем случае потеряются последние записи, их легко получить заново
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "video_id TEXT PRIMARY KEY, "
+                "title TEXT NOT NULL, "
+                "duration INTEGER, "
+                "thumbnail_url TEXT, "
+                "updated_at REAL NOT NULL)"
+            )
+
+    def get(self, video_id: Optional[str]) -> Optional[Dict]:
+        if not video_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, duration, thumbnail_url FROM tracks WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"title": row[0], "duration": row[1], "thumbnail_url": row[2]}
+
+    def put(self, video_id: Optional[str], title: Optional[str], duration: Optional[int] = None,
+            thumbnail_url: Optional[str] = None):
+        """Добавляет или дополняет запись; известные поля не затираются пустыми"""
+        self.put_many([(video_id, title, duration, thumbnail_url)])
+
+    def put_many(self, records: Iterable[Tuple]):
+        """То же для пачки (video_id, title, duration, thumbnail_url) - одна транзакция на всё"""
+        now = time.time()
+        rows = [
+            (video_id, title, int(duration) if duration else None, thumbnail_url, now)
+            for video_id, title, duration, thumbnail_url in records
+            if video_id and title
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO tracks (video_id, title, duration, thumbnail_url, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET "
+                "title = excluded.title, "
+                "duration = COALESCE(excluded.duration, tracks.duration), "
+                "thumbnail_url = COALESCE(excluded.thumbnail_url, tracks.thumbnail_url), "
+                "updated_at = excluded.updated_at",
+                rows
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
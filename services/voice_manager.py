@@ -0,0 +1,99 @@
+import asyncio
+from typing import Dict, Optional
+
+import discord
+
+MUSIC = "music"
+GREETER = "greeter"
+# Чем меньше число, тем важнее владелец: музыка вытесняет приветствие, но не наоборот
+OWNER_PRIORITIES = {MUSIC: 0, GREETER: 1}
+
+
+class VoiceManager:
+    """Общие голосовые подключения для модулей одного бота.
+
+    На сервере у бота может быть только одно подключение, поэтому модули
+    не подключаются сами, а берут его здесь. У подключения один владелец:
+    более важный модуль забирает его, останавливая чужой звук, менее важный
+    получает отказ и может подождать, пока подключение освободят.
+    """
+
+    def __init__(self, priorities: Optional[Dict[str, int]] = None):
+        self.priorities = priorities or OWNER_PRIORITIES
+        self._owners: Dict[int, str] = {}  # guild_id -> владелец подключения
+        self._released: Dict[int, asyncio.Event] = {}
+
+    def owner(self, guild_id: int) -> Optional[str]:
+        return self._owners.get(guild_id)
+
+    def can_use(self, guild_id: int, owner: str) -> bool:
+        holder = self._owners.get(guild_id)
+        return holder is None or holder == owner or self.priorities[owner] < self.priorities[holder]
+
+    def claim(self, guild: discord.Guild, owner: str) -> bool:
+        """Забирает уже открытое подключение (или право открыть его) себе"""
+        if not self.can_use(guild.id, owner):
+            return False
+        holder = self._owners.get(guild.id)
+        self._owners[guild.id] = owner
+        vc = guild.voice_client
+        if holder not in (None, owner) and vc and vc.is_playing():
+            vc.stop()  # Прерываем звук менее важного модуля
+        return True
+
+    async def connect(self, channel: discord.VoiceChannel, owner: str,
+                      move: bool = True) -> Optional[discord.VoiceClient]:
+        """Возвращает подключение к каналу или None, если оно занято более важным модулем.
+
+        move=False оставляет своё подключение в текущем канале.
+        """
+        guild = channel.guild
+        holder = self._owners.get(guild.id)
+        if not self.claim(guild, owner):
+            return None
+
+        vc = guild.voice_client
+        if vc and vc.is_connected():
+            if vc.channel != channel and (move or holder != owner):
+                await vc.move_to(channel)
+            return vc
+        if vc:
+            await vc.disconnect(force=True)
+        return await channel.connect()
+
+    def release(self, guild_id: int, owner: str) -> bool:
+        """Отдаёт подключение; True - если теперь оно никому не принадлежит"""
+        holder = self._owners.get(guild_id)
+        if holder not in (None, owner):
+            return False
+        self._owners.pop(guild_id, None)
+        event = self._released.pop(guild_id, None)
+        if event:
+            event.set()
+        return True
+
+    async def wait_available(self, guild_id: int, owner: str, timeout: float) -> bool:
+        """Ждёт, пока подключение освободится; False - не дождались"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.can_use(guild_id, owner):
+            event = self._released.setdefault(guild_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def disconnect(self, guild: discord.Guild):
+        """Отключается, только если подключение никому не принадлежит"""
+        vc = guild.voice_client
+        if vc and guild.id not in self._owners:
+            await vc.disconnect()
+
+
+def get_voice_manager(bot) -> VoiceManager:
+    """Один менеджер на бота: его делят все загруженные модули"""
+    manager = getattr(bot, "voice_manager", None)
+    if manager is None:
+        manager = bot.voice_manager = VoiceManager()
+    return manager
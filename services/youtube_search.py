@@ -0,0 +1,145 @@
+import asyncio
+import html
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Частичные ответы API: запрашиваем только поля, которые реально используются
+SEARCH_FIELDS = "items(id/videoId,snippet(title,channelTitle,thumbnails/high/url,thumbnails/default/url))"
+VIDEOS_FIELDS = "items(id,contentDetails/duration)"
+
+ISO8601_DURATION_RE = re.compile(
+    r'^P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?'
+    r'(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$'
+)
+
+
+def parse_iso8601_duration(value: str) -> Optional[int]:
+    """Переводит длительность ISO 8601 (PT4M13S, P1DT2H) в секунды"""
+    match = ISO8601_DURATION_RE.match(value or "")
+    if not match:
+        return None
+    parts = {name: float(number) for name, number in match.groupdict().items() if number}
+    return int(
+        parts.get("weeks", 0) * 604800 + parts.get("days", 0) * 86400 + parts.get("hours", 0) * 3600
+        + parts.get("minutes", 0) * 60 + parts.get("seconds", 0)
+    )
+
+
+class YouTubeSearchClient:
+    """Неблокирующий клиент YouTube Data API.
+
+    Синхронные запросы googleapiclient выполняются в собственном пуле потоков,
+    поэтому медленный поиск не останавливает event loop бота.
+    httplib2.Http не потокобезопасен, так что у каждого потока свой клиент.
+    """
+
+    def __init__(self, api_key: str, max_concurrency: int = 4, timeout: float = 10.0):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="youtube-search")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._local = threading.local()
+
+    def _get_client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            # Импорт и сборка клиента идут в потоке пула; документ discovery
+            # берётся из копии внутри googleapiclient, без запроса к API
+            import httplib2
+            from googleapiclient.discovery import build
+
+            client = build(
+                "youtube", "v3",
+                developerKey=self.api_key,
+                http=httplib2.Http(timeout=self.timeout),
+                cache_discovery=False,
+                static_discovery=True
+            )
+            self._local.client = client
+        return client
+
+    async def warm_up(self):
+        """Заранее собирает клиент в одном из потоков, чтобы первый поиск не ждал"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._get_client)
+
+    async def _execute(self, make_request):
+        """Выполняет запрос в пуле потоков с ограничением параллельности и таймаутом"""
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, lambda: make_request(self._get_client()).execute()),
+                timeout=self.timeout
+            )
+
+    async def search(self, query: str, max_results: int, max_duration: Optional[int] = None,
+                     video_duration: Optional[str] = None,
+                     known_durations: Callable[[str], Optional[int]] = None) -> List[Dict]:
+        """Ищет видео; duration в результатах - длительность в секундах.
+
+        video_duration - фильтр API ("short" < 4 мин, "medium" 4-20 мин, "long" > 20 мин),
+        max_duration - дополнительный фильтр в секундах. Длительность запрашивается
+        отдельным дешёвым videos.list только для видео, которых нет в known_durations.
+        """
+        params = {}
+        if video_duration:
+            params["videoDuration"] = video_duration
+        search_response = await self._execute(lambda youtube: youtube.search().list(
+            q=query,
+            part="snippet",
+            maxResults=25 if max_duration else max_results,  # С запасом, если часть отсеется
+            type="video",
+            videoEmbeddable="true",
+            order="relevance",  # Sort by relevance
+            safeSearch="none",
+            fields=SEARCH_FIELDS,
+            **params
+        ))
+
+        # Пропускаем элементы без videoId (каналы/плейлисты иногда проскакивают)
+        items = [item for item in search_response.get("items", []) if item.get("id", {}).get("videoId")]
+        if not items:
+            return []
+
+        durations = {}
+        if known_durations:
+            for item in items:
+                video_id = item["id"]["videoId"]
+                duration = known_durations(video_id)
+                if duration:
+                    durations[video_id] = int(duration)
+
+        missing = [item["id"]["videoId"] for item in items if item["id"]["videoId"] not in durations]
+        if missing:
+            videos_response = await self._execute(lambda youtube: youtube.videos().list(
+                part="contentDetails",
+                id=",".join(missing),
+                fields=VIDEOS_FIELDS
+            ))
+            for item in videos_response.get("items", []):
+                durations[item["id"]] = parse_iso8601_duration(item["contentDetails"]["duration"])
+
+        results = []
+        for item in items:
+            video_id = item["id"]["videoId"]
+            duration = durations.get(video_id)
+            if duration is None or (max_duration and duration > max_duration):
+                continue  # Видео недоступно или слишком длинное
+
+            snippet = item["snippet"]
+            thumbnails = snippet.get("thumbnails", {})
+            thumbnail = thumbnails.get("high") or thumbnails.get("default") or {}
+            results.append({
+                "video_id": video_id,
+                "title": html.unescape(snippet["title"]),
+                "url": f"https://www.youtube.com/watch?v={video_id}",
+                "thumbnail_url": thumbnail.get("url"),
+                "duration": duration,
+                "channel": html.unescape(snippet["channelTitle"])
+            })
+
+            if len(results) >= max_results:
+                break
+
+        return results
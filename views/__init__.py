@@ -1,3 +1,4 @@
+from .queue_view import QueueView
 from .search_result_view import SearchResultView
 
-__all__ = ['SearchResultView']
\ No newline at end of file
+__all__ = ['QueueView', 'SearchResultView']
\ No newline at end of file
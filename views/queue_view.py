@@ -0,0 +1,107 @@
+import math
+
+import discord
+from discord.ui import View, Button
+
+PAGE_SIZE = 10
+
+
+def format_duration(seconds) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class QueueView(View):
+    """Очередь по страницам: рисуется только видимая страница, а не вся очередь"""
+
+    def __init__(self, ctx, player, page_size: int = PAGE_SIZE):
+        super().__init__(timeout=120)
+        self.ctx = ctx
+        self.player = player
+        self.page_size = page_size
+        self.page = 0
+        self.message = None
+        self.setup_buttons()
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(len(self.player.queue) / self.page_size))
+
+    def setup_buttons(self):
+        self.prev_button = Button(style=discord.ButtonStyle.gray, emoji="◀️")
+        self.prev_button.callback = lambda interaction: self.turn_page(interaction, -1)
+        self.add_item(self.prev_button)
+
+        self.next_button = Button(style=discord.ButtonStyle.gray, emoji="▶️")
+        self.next_button.callback = lambda interaction: self.turn_page(interaction, 1)
+        self.add_item(self.next_button)
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.prev_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count - 1
+
+    async def turn_page(self, interaction: discord.Interaction, step: int):
+        # Очередь могла измениться, пока страница была открыта
+        self.page = min(max(self.page + step, 0), self.page_count - 1)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)
+
+    def get_remaining_duration(self):
+        """Сколько осталось играть: конец текущего трека плюс вся очередь"""
+        total = self.player.queue.total_duration
+        view = self.player.view
+        if view and view.duration:
+            total += max(0, view.duration - view.get_elapsed())
+        return total
+
+    def create_embed(self) -> discord.Embed:
+        queue = self.player.queue
+        embed = discord.Embed(title="📜 Очередь", color=discord.Color.blue())
+
+        if self.player.current:
+            embed.add_field(name="🎵 Сейчас играет", value=self.player.current.title, inline=False)
+
+        if not queue:
+            embed.description = "📭 Очередь пуста!"
+            return embed
+
+        start = self.page * self.page_size
+        lines = []
+        for i, entry in enumerate(queue[start:start + self.page_size], start + 1):
+            title = entry.title[:70] + "..." if len(entry.title) > 70 else entry.title
+            duration = format_duration(entry.duration) if entry.duration else "--:--"
+            lines.append(f"`{i}.` {title} ・ ⏱️ {duration}")
+        embed.description = "\n".join(lines)
+
+        total_tracks = len(queue)
+        tracks_word = 'трек' if total_tracks == 1 else 'трека' if 1 < total_tracks < 5 else 'треков'
+        remaining = format_duration(self.get_remaining_duration())
+        if queue.unknown_durations:
+            remaining += "+"  # Длительность части треков неизвестна
+        embed.set_footer(
+            text=f"Страница {self.page + 1}/{self.page_count} • 📑 {total_tracks} {tracks_word} • ⏱️ {remaining}"
+        )
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user != self.ctx.author:
+            await interaction.response.send_message("❌ Это не ваша команда!", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    async def show_queue(self):
+        self.message = await self.ctx.send(embed=self.create_embed(), view=self)
+        return self.message
@@ -1,16 +1,35 @@
+import asyncio
 import discord
 from discord.ui import View, Button
-from typing import List, Dict
+from typing import Awaitable, Callable, List, Dict, Optional
 
 NUMBER_EMOJIS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
 
 class SearchResultView(View):
-    def __init__(self, ctx, results: List[Dict]):
+    def __init__(self, ctx, results: List[Dict], prefetch: Optional[Callable[[str], Awaitable]] = None,
+                 prefetch_count: int = 3):
         super().__init__(timeout=30)
         self.ctx = ctx
         self.results = results
+        # Пока пользователь выбирает, стримы первых результатов разрешаются заранее
+        self.prefetch = prefetch
+        self.prefetch_count = prefetch_count
+        self.prefetch_tasks = {}  # url -> asyncio.Task
         self.setup_buttons()
 
+    def start_prefetch(self):
+        if not self.prefetch:
+            return
+        for result in self.results[:self.prefetch_count]:
+            self.prefetch_tasks[result["url"]] = asyncio.create_task(self.prefetch(result["url"]))
+
+    def cancel_prefetch(self, keep: Optional[str] = None):
+        """Отменяет предзагрузку всех результатов, кроме выбранного"""
+        for url, task in self.prefetch_tasks.items():
+            if url != keep:
+                task.cancel()
+        self.prefetch_tasks.clear()
+
     async def button_callback(self, interaction: discord.Interaction):
         try:
             if not await self.interaction_check(interaction):
@@ -20,6 +39,7 @@ class SearchResultView(View):
             index = int(interaction.data.get('custom_id', '0'))
             if 0 <= index < len(self.results):
                 selected_result = self.results[index]
+                self.cancel_prefetch(keep=selected_result["url"])
 
                 # Disable all buttons
                 for item in self.children:
@@ -61,9 +81,12 @@ class SearchResultView(View):
                 for i, result in enumerate(self.results[:len(NUMBER_EMOJIS)]):
                     title = result['title'][:70] + "..." if len(result['title']) > 70 else result['title']
                     emoji = NUMBER_EMOJIS[i]
+                    minutes, seconds = divmod(result['duration'], 60)
+                    hours, minutes = divmod(minutes, 60)
+                    duration = f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
                     description.append(
                         f"{emoji} **{title}**\n"
-                        f"└ 📺 **{result['channel']}** ・ ⏱️ {result['duration']}\n"
+                        f"└ 📺 **{result['channel']}** ・ ⏱️ {duration}\n"
                         "─────────────"
                     )
 
@@ -87,10 +110,14 @@ class SearchResultView(View):
             return False
         return True
 
+    async def on_timeout(self):
+        self.cancel_prefetch()
+
     async def select_result(self, interaction: discord.Interaction, index: int):
         """Legacy method, now handled in button_callback"""
         pass
 
     async def show_search_results(self):
         embed = self.create_embed()
+        self.start_prefetch()
         return await self.ctx.send(embed=embed, view=self)